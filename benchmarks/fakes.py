@@ -0,0 +1,77 @@
+import json
+import re
+import time
+
+from langchain_core.language_models.llms import LLM
+
+from src.data_access.embeddings import HashingEmbeddings as BaseHashingEmbeddings
+
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+_TABLE_RE = re.compile(r"^Table: (\S+)\n((?:- .*(?:\n|$))*)", re.MULTILINE)
+_COLUMN_RE = re.compile(r"^- (\S+) ", re.MULTILINE)
+
+
+def _words(text: str) -> list[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+class HashingEmbeddings(BaseHashingEmbeddings):
+    """The offline hashing embedder, with an optional simulated API latency per call."""
+
+    def __init__(self, dimensions: int = 256, latency_ms: float = 0):
+        super().__init__(dimensions)
+        self.latency_ms = latency_ms
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return super().embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return super().embed_query(text)
+
+
+class FakeSQLModel(LLM):
+    """Answers the SQL prompt of retriever_chain by picking the retrieved table that best matches the question."""
+
+    latency_ms: float = 0
+    row_limit: int = 100
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-sql"
+
+    def _call(self, prompt: str, stop=None, run_manager=None, **kwargs) -> str:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        context, _, question = prompt.partition("QUESTION:")
+        question = set(_words(question.partition("RESPONSE:")[0]))
+
+        best, best_score = None, -1
+        for table, body in _TABLE_RE.findall(context.partition("SCHEMA:")[2]):
+            if table.startswith("information_schema."):
+                continue
+            columns = _COLUMN_RE.findall(body)
+            score = 3 * len(question & set(table.rpartition(".")[2].split("_"))) + len(question & set(columns))
+            if score > best_score:
+                best, best_score = (table, columns), score
+        if best is None:
+            return json.dumps({"sql": "SELECT 1", "plot": False})
+
+        table, columns = best
+        selected = [column for column in columns if column in question] or columns[:2]
+        return json.dumps({
+            "sql": f"SELECT {', '.join(selected)} FROM {table} LIMIT {self.row_limit}",
+            "plot": False,
+        })
+
+
+def make_check_ambiguity(latency_ms: float = 0):
+    """Return a check_ambiguity replacement that never finds the question ambiguous."""
+    def check_ambiguity(user_query: str, schema_text: str) -> dict:
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        return {"ambiguous": False, "clarify": []}
+    return check_ambiguity
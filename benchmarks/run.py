@@ -0,0 +1,343 @@
+from config import config as cfg
+from benchmarks.fakes import FakeSQLModel, HashingEmbeddings, make_check_ambiguity
+from benchmarks.synthetic_db import BENCH_SCHEMA, seed_database, start_local_postgres, synthetic_tables
+
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import functools
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from psycopg2.extensions import parse_dsn
+
+SHARD = "bench"
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+STAGES = ["route", "answer_cache", "ambiguity", "generation", "execution"]
+
+
+class StageTimer:
+    """Collects wall-clock durations per pipeline stage from any thread."""
+
+    def __init__(self):
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.durations.setdefault(stage, []).append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.durations = {}
+
+    def wrap(self, stage: str, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+    def wrap_async(self, stage: str, fn):
+        @functools.wraps(fn)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - start)
+        return timed
+
+
+def summarize(durations: list[float]) -> dict:
+    if not durations:
+        return {"count": 0}
+    ordered = sorted(durations)
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def build_workload(tables: list[dict], count: int, repeat_ratio: float, seed: int) -> list[str]:
+    """Questions naming a table and one or two of its columns; repeat_ratio of them re-ask an earlier question."""
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(count):
+        if questions and rng.random() < repeat_ratio:
+            questions.append(rng.choice(questions))
+            continue
+        table = rng.choice(tables)
+        columns = [name for name, _ in table["columns"]]
+        picked = rng.sample(columns, min(2, len(columns)))
+        questions.append(f"show {' and '.join(picked)} of {table['name'].replace('_', ' ')}")
+    return questions
+
+
+def _install_fakes(args, timer: StageTimer, schema_path: str, vectorstore_dir: str, conn_params: dict) -> dict:
+    """Point the pipeline at the seeded database and the fake models; returns the setup stage timings."""
+    cfg.DATABASES = {SHARD: {"schema_file": schema_path, "conn_params": conn_params}}
+    cfg.DEFAULT_DATABASE = SHARD
+
+    from langchain_community.vectorstores import Chroma
+    from src.data_access.numpy_vectorstore import NumpyVectorStore
+    from src.data_access.shards import reload_shards
+    from src.data_access.schema_extractor import get_schema_json
+    from src.data_access.vectorestore_manager import get_schema_documents, add_info_schema_docs, sync_documents
+    from src.data_access.vectorstore_singleton import set_vectorstore
+    from src.services import handle_query, retriever_chain
+
+    reload_shards()
+    setup = {}
+
+    start = time.perf_counter()
+    schema = get_schema_json(BENCH_SCHEMA, shard=SHARD)
+    setup["schema_extraction_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    with open(schema_path, "w") as f:
+        json.dump(schema, f)
+
+    embeddings = HashingEmbeddings(latency_ms=args.embedding_latency_ms)
+    start = time.perf_counter()
+    if args.vectorstore == "numpy":
+        vectorstore = NumpyVectorStore(embeddings, os.path.join(vectorstore_dir, f"schema_{SHARD}"))
+    else:
+        vectorstore = Chroma(collection_name=f"schema_{SHARD}", embedding_function=embeddings,
+                             persist_directory=vectorstore_dir)
+    sync_documents(vectorstore, get_schema_documents(SHARD) + add_info_schema_docs(), embeddings.model)
+    setup["indexing_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    set_vectorstore(vectorstore, SHARD)
+
+    model = FakeSQLModel(latency_ms=args.llm_latency_ms)
+    retriever_chain.get_chat_model = lambda model_name, temperature=0: model
+    handle_query.check_ambiguity = make_check_ambiguity(args.llm_latency_ms)
+
+    handle_query.route_question = timer.wrap("route", handle_query.route_question)
+    handle_query._lookup_answer = timer.wrap("answer_cache", handle_query._lookup_answer)
+    handle_query.check_for_ambiguity = timer.wrap("ambiguity", handle_query.check_for_ambiguity)
+    handle_query.get_llm_generated_query = timer.wrap("generation", handle_query.get_llm_generated_query)
+    handle_query._execute_first_page = timer.wrap_async("execution", handle_query._execute_first_page)
+    return setup
+
+
+def _succeeded(response) -> bool:
+    result = response.get("result") if isinstance(response, dict) else None
+    if not isinstance(result, dict):
+        return False
+    rows = result.get("rows") or []
+    return bool(result.get("columns")) or not (rows and str(rows[0][0]).startswith("⚠️ Error"))
+
+
+def _reset_caches():
+    from src.data_access.result_cache import result_cache
+    from src.data_access.result_cursor import close_all_cursors
+    from src.services.answer_cache import get_answer_cache
+
+    result_cache.clear()
+    get_answer_cache(SHARD).clear()
+    close_all_cursors()
+
+
+async def _run_clients(call, questions: list[str], clients: int) -> tuple[list[float], float, int]:
+    """Split questions over concurrent clients; returns (latencies, elapsed seconds, error count)."""
+    latencies = []
+    errors = 0
+
+    async def client(assigned: list[str]):
+        nonlocal errors
+        for question in assigned:
+            start = time.perf_counter()
+            ok = await call(question)
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(questions[i::clients]) for i in range(clients)))
+    return latencies, time.perf_counter() - start, errors
+
+
+async def _run_scenario(call, questions: list[str], clients: int, timer: StageTimer) -> dict:
+    _reset_caches()
+    timer.reset()
+    tracemalloc.start()
+    try:
+        latencies, elapsed, errors = await _run_clients(call, questions, clients)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "clients": clients,
+        "queries": len(latencies),
+        "errors": errors,
+        "throughput_qps": round(len(latencies) / elapsed, 3) if elapsed else None,
+        "latency": summarize(latencies),
+        "stages": {stage: summarize(timer.durations.get(stage, [])) for stage in STAGES},
+        "peak_traced_bytes": peak,
+    }
+
+
+async def run_benchmarks(args, timer: StageTimer, questions: list[str]) -> dict:
+    from src.services.handle_query import handle_query
+
+    async def direct(question: str) -> bool:
+        return _succeeded(await handle_query(question, [], database=SHARD))
+
+    scenarios = {}
+    for clients in args.clients:
+        scenarios[f"handle_query_c{clients}"] = await _run_scenario(direct, questions, clients, timer)
+
+    if args.api:
+        import httpx
+        from src.main import app
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                     timeout=None) as http:
+            async def api(question: str) -> bool:
+                response = await http.post("/api/query", json={"query": question, "database": SHARD})
+                return response.status_code == 200 and _succeeded(response.json())
+
+            for clients in args.clients:
+                scenarios[f"api_query_c{clients}"] = await _run_scenario(api, questions, clients, timer)
+    return scenarios
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Return a line per scenario metric that got worse than baseline by more than threshold (a fraction)."""
+    regressions = []
+    for name, scenario in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        checks = [("throughput_qps", scenario.get("throughput_qps"), before.get("throughput_qps"), -1)]
+        for metric in ("p50_ms", "p95_ms"):
+            checks.append((f"latency.{metric}", scenario["latency"].get(metric), before["latency"].get(metric), 1))
+            for stage in STAGES:
+                checks.append((f"stages.{stage}.{metric}", scenario["stages"].get(stage, {}).get(metric),
+                               before["stages"].get(stage, {}).get(metric), 1))
+        checks.append(("peak_traced_bytes", scenario["peak_traced_bytes"], before.get("peak_traced_bytes"), 1))
+
+        for metric, now, then, direction in checks:
+            if not now or not then:
+                continue
+            change = (now - then) / then
+            if change * direction > threshold:
+                regressions.append(f"{name} {metric}: {then} -> {now} ({change:+.0%})")
+    return regressions
+
+
+def _print_summary(results: dict):
+    print(f"setup: {results['setup']}")
+    for name, scenario in results["scenarios"].items():
+        latency = scenario["latency"]
+        print(f"{name}: {scenario['throughput_qps']} q/s, p50 {latency.get('p50_ms')} ms, "
+              f"p95 {latency.get('p95_ms')} ms, {scenario['errors']} errors, "
+              f"peak {scenario['peak_traced_bytes'] / 1e6:.1f} MB")
+        for stage, summary in scenario["stages"].items():
+            if summary["count"]:
+                print(f"    {stage:<13} n={summary['count']:<5} p50 {summary['p50_ms']} ms  p95 {summary['p95_ms']} ms")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the query pipeline offline: fake LLM and embeddings, a seeded local Postgres.")
+    parser.add_argument("--tables", type=int, default=50, help="tables in the synthetic schema")
+    parser.add_argument("--columns", type=int, default=6, help="non-key columns per table")
+    parser.add_argument("--rows", type=int, default=1000, help="rows per table")
+    parser.add_argument("--queries", type=int, default=200, help="questions per scenario")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="share of questions asked again")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 8], help="concurrent client counts")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="simulated latency per LLM call")
+    parser.add_argument("--embedding-latency-ms", type=float, default=0, help="simulated latency per embedding call")
+    parser.add_argument("--vectorstore", choices=["chroma", "numpy"], default="chroma",
+                        help="schema index to retrieve from")
+    parser.add_argument("--api", action="store_true", help="also drive /api/query through the ASGI app")
+    parser.add_argument("--dsn", help="scratch Postgres to seed instead of a throwaway pgserver instance")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file; exits 1 on regressions beyond --threshold")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative regression")
+    parser.add_argument("--verbose", action="store_true", help="keep the pipeline's own output")
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.dsn:
+        conn_params = parse_dsn(args.dsn)
+    else:
+        server, conn_params = start_local_postgres()
+
+    timer = StageTimer()
+    workdir = tempfile.mkdtemp(prefix="talk2tables_bench_")
+    try:
+        tables = synthetic_tables(args.tables, args.columns, args.seed)
+        start = time.perf_counter()
+        seed_database(conn_params, tables, args.rows)
+        seeding_ms = round((time.perf_counter() - start) * 1000, 3)
+        questions = build_workload(tables, args.queries, args.repeat_ratio, args.seed)
+
+        with open(os.devnull, "w") as devnull, redirect_stdout(sys.stdout if args.verbose else devnull):
+            setup = _install_fakes(args, timer, os.path.join(workdir, "bench_schema.json"),
+                                   os.path.join(workdir, "vectorstore"), conn_params)
+            scenarios = asyncio.run(run_benchmarks(args, timer, questions))
+            from src.data_access.db_executor import close_pool
+            close_pool()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        if server is not None:
+            server.cleanup()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "params": {key: value for key, value in vars(args).items()
+                       if key not in ("output", "compare", "dsn", "verbose")},
+        },
+        "setup": {"seeding_ms": seeding_ms, **setup},
+        "scenarios": scenarios,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    _print_summary(results)
+    print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import random
+import tempfile
+
+import psycopg2
+from psycopg2.extensions import parse_dsn
+
+BENCH_SCHEMA = "talk2tables_bench"
+
+TABLE_WORDS = ["orders", "customers", "invoices", "shipments", "products", "payments",
+               "sensors", "readings", "accounts", "events", "prices", "trades"]
+# Shared across tables on purpose, so some questions hit the ambiguity check
+COLUMN_WORDS = ["amount", "price", "quantity", "status", "region", "score", "ticker",
+                "volume", "label", "created_at", "updated_at", "category"]
+COLUMN_TYPES = {"amount": "numeric(12, 2)", "price": "numeric(12, 2)", "quantity": "integer",
+                "score": "double precision", "volume": "bigint", "created_at": "timestamp",
+                "updated_at": "timestamp"}
+_TYPE_VALUES = {
+    "numeric(12, 2)": "round((random() * 1000)::numeric, 2)",
+    "integer": "(random() * 100)::integer",
+    "double precision": "random()",
+    "bigint": "(random() * 1000000)::bigint",
+    "timestamp": "timestamp '2024-01-01' + g * interval '1 minute'",
+    "text": "'v' || (g %% 50)",  # %% survives the %s parameter substitution
+}
+
+
+def start_local_postgres():
+    """Start a throwaway embedded Postgres (requires the pgserver package); returns (server, conn_params)."""
+    try:
+        import pgserver
+    except ImportError:
+        raise SystemExit("The benchmark needs pgserver for a local database (pip install pgserver), "
+                         "or --dsn pointing at a scratch database.")
+    server = pgserver.get_server(tempfile.mkdtemp(prefix="talk2tables_bench_"), cleanup_mode="delete")
+    return server, parse_dsn(server.get_uri())
+
+
+def synthetic_tables(table_count: int, column_count: int, seed: int = 0) -> list[dict]:
+    """Return [{"name", "columns": [(name, type)]}]; table i references table i - 1 so the schema has FKs."""
+    rng = random.Random(seed)
+    tables = []
+    for i in range(table_count):
+        name = f"{TABLE_WORDS[i % len(TABLE_WORDS)]}_{i}"
+        columns = [("id", "integer")]
+        if i:
+            columns.append((f"{tables[-1]['name']}_id", "integer"))
+        for word in rng.sample(COLUMN_WORDS, min(column_count, len(COLUMN_WORDS))):
+            columns.append((word, COLUMN_TYPES.get(word, "text")))
+        tables.append({"name": name, "columns": columns})
+    return tables
+
+
+def seed_database(conn_params: dict, tables: list[dict], row_count: int, schema: str = BENCH_SCHEMA):
+    """(Re)create schema with the given tables, each filled with row_count generated rows."""
+    conn = psycopg2.connect(**conn_params)
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            cur.execute(f"CREATE SCHEMA {schema}")
+            previous = None
+            for table in tables:
+                column_defs = []
+                for column, column_type in table["columns"]:
+                    definition = f"{column} {column_type}"
+                    if column == "id":
+                        definition += " PRIMARY KEY"
+                    elif previous and column == f"{previous}_id":
+                        definition += f" REFERENCES {schema}.{previous}(id)"
+                    column_defs.append(definition)
+                cur.execute(f"CREATE TABLE {schema}.{table['name']} ({', '.join(column_defs)})")
+
+                values = ["g" if column == "id" or column.endswith("_id") else _TYPE_VALUES[column_type]
+                          for column, column_type in table["columns"]]
+                cur.execute(f"INSERT INTO {schema}.{table['name']} "
+                            f"SELECT {', '.join(values)} FROM generate_series(1, %s) AS g", (row_count,))
+                previous = table["name"]
+            cur.execute("ANALYZE")
+    finally:
+        conn.close()
@@ -1,22 +1,283 @@
+import asyncio
+import datetime
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
 import psycopg2
-from config.config import DB_CONN_PARAMS
+import sqlparse
+from psycopg2 import pool
+from sqlparse.tokens import Comment, Punctuation
+from config import config as cfg
+from src.data_access.shards import get_shard
+from src.data_access.result_cache import result_cache, ResultCollector
+from src.utils.tracing import span
+
+POOL_MIN_CONN = getattr(cfg, "DB_POOL_MIN_CONN", 1)
+POOL_MAX_CONN = getattr(cfg, "DB_POOL_MAX_CONN", 10)
+HEALTH_CHECK_SECONDS = getattr(cfg, "DB_POOL_HEALTH_CHECK_SECONDS", 30)
+POOL_ACQUIRE_TIMEOUT = getattr(cfg, "DB_POOL_ACQUIRE_TIMEOUT_SECONDS", 30)
+STATEMENT_TIMEOUT_MS = getattr(cfg, "DB_STATEMENT_TIMEOUT_MS", 30000)
+READ_ONLY = getattr(cfg, "DB_READ_ONLY", True)
+STREAM_BATCH_SIZE = getattr(cfg, "RESULT_STREAM_BATCH_SIZE", 2000)
+TYPE_SAMPLE_ROWS = 100
+
+# Built-in Postgres type OIDs (pg_type.oid) -> the category reported in a response's "types"
+PG_TYPE_CATEGORIES = {
+    **dict.fromkeys((20, 21, 23, 26, 700, 701, 790, 1700), "number"),  # int8/2/4, oid, float4/8, money, numeric
+    **dict.fromkeys((1082, 1114, 1184), "date"),  # date, timestamp, timestamptz
+    **dict.fromkeys((1083, 1266), "time"),  # time, timetz
+    1186: "interval",
+    16: "boolean",
+    **dict.fromkeys((114, 3802), "json"),  # json, jsonb
+    **dict.fromkeys((18, 19, 25, 1042, 1043, 2950), "string"),  # char, name, text, bpchar, varchar, uuid
+}
+
+_pools = {}  # shard name -> (ThreadedConnectionPool, BoundedSemaphore)
+_pool_lock = threading.Lock()
+_checked_out = {}  # id(conn) -> (pool, slots) it was taken from
+_last_used = {}
+
+
+def get_pool(shard: str | None = None) -> tuple[pool.ThreadedConnectionPool, threading.BoundedSemaphore]:
+    """Return the shard's pool and the semaphore bounding its checkouts.
+
+    psycopg2 raises when a pool is exhausted; the semaphore makes callers wait instead,
+    for up to POOL_ACQUIRE_TIMEOUT seconds.
+    """
+    target = get_shard(shard)
+    entry = _pools.get(target.name)
+    if entry is None:
+        with _pool_lock:
+            entry = _pools.get(target.name)
+            if entry is None:
+                entry = (pool.ThreadedConnectionPool(POOL_MIN_CONN, POOL_MAX_CONN, **target.conn_params),
+                         threading.BoundedSemaphore(POOL_MAX_CONN))
+                _pools[target.name] = entry
+    return entry
+
+
+def _close_if_idle(db_pool):
+    if not any(checked_out_pool is db_pool for checked_out_pool, _ in list(_checked_out.values())):
+        db_pool.closeall()
+
+
+def close_shard_pool(shard: str):
+    """Close a shard's pool; connections still checked out (e.g. by open cursors) close when released."""
+    with _pool_lock:
+        entry = _pools.pop(shard, None)
+    if entry is not None:
+        _close_if_idle(entry[0])
+
+
+def close_pool():
+    with _pool_lock:
+        for db_pool, _ in _pools.values():
+            db_pool.closeall()
+        _pools.clear()
+        _last_used.clear()
+
+
+def _is_healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < HEALTH_CHECK_SECONDS:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _checkout(db_pool):
+    conn = db_pool.getconn()
+    if not _is_healthy(conn):
+        _last_used.pop(id(conn), None)
+        db_pool.putconn(conn, close=True)
+        conn = db_pool.getconn()
+    return conn
+
+
+def acquire_connection(read_only: bool = READ_ONLY, statement_timeout_ms: int = STATEMENT_TIMEOUT_MS,
+                       shard: str | None = None):
+    """Check a connection out of the shard's pool and open a transaction scoped by read-only mode and statement timeout.
+
+    Every call must be paired with release_connection. Raises pool.PoolError when no connection
+    frees up within POOL_ACQUIRE_TIMEOUT seconds, rather than blocking the worker thread indefinitely.
+    """
+    db_pool, slots = get_pool(shard)
+    if not slots.acquire(timeout=POOL_ACQUIRE_TIMEOUT):
+        raise pool.PoolError(f"Database busy: all {POOL_MAX_CONN} connections stayed in use for "
+                             f"{POOL_ACQUIRE_TIMEOUT} s. Please try again shortly.")
+    conn = None
+    try:
+        conn = _checkout(db_pool)
+        conn.readonly = read_only
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL statement_timeout = %s", (statement_timeout_ms,))
+        _checked_out[id(conn)] = (db_pool, slots)
+        return conn
+    except Exception:
+        if conn is not None:
+            db_pool.putconn(conn, close=True)
+        slots.release()
+        raise
+
+
+def release_connection(conn):
+    db_pool, slots = _checked_out.pop(id(conn))
+    try:
+        if not conn.closed:
+            conn.rollback()
+    except psycopg2.Error:
+        conn.close()  # broken connection; the pool discards it below
+    _last_used[id(conn)] = time.monotonic()
+    try:
+        db_pool.putconn(conn, close=conn.closed != 0)
+        if all(db_pool is not entry[0] for entry in list(_pools.values())):
+            _close_if_idle(db_pool)  # the last connection of a closed shard pool
+    finally:
+        slots.release()
+
 
-def execute_sql(sql: str):
+@contextmanager
+def get_connection(read_only: bool = READ_ONLY, statement_timeout_ms: int = STATEMENT_TIMEOUT_MS,
+                   shard: str | None = None):
+    """Borrow a pooled connection for the duration of a with-block."""
+    conn = acquire_connection(read_only, statement_timeout_ms, shard)
     try:
-        conn = psycopg2.connect(**DB_CONN_PARAMS)
-        cur = conn.cursor()
-        cur.execute(sql)
-        
-        if cur.description:  # If the query returns rows
+        yield conn
+    finally:
+        release_connection(conn)
+
+
+def _sample_type(values) -> str:
+    sample = next((value for value in values if value is not None), None)
+    if isinstance(sample, bool):
+        return "boolean"
+    if isinstance(sample, (int, float, Decimal)):
+        return "number"
+    if isinstance(sample, (datetime.date, datetime.datetime)):
+        return "date"
+    if isinstance(sample, (dict, list)):
+        return "json"
+    return "string"
+
+
+def column_types(description, rows: list) -> list[str]:
+    """Map cursor.description type OIDs to type categories; only unknown OIDs
+    (enums, arrays, extension types) fall back to inspecting a sample of rows."""
+    types = []
+    with span("type_inference"):
+        for index, column in enumerate(description):
+            category = PG_TYPE_CATEGORIES.get(column.type_code)
+            if category is None:
+                category = _sample_type(row[index] for row in rows[:TYPE_SAMPLE_ROWS])
+            types.append(category)
+    return types
+
+
+def split_statements(sql: str) -> list:
+    """Parsed statements of sql, without the empty ones a trailing comment or extra ';' leaves behind."""
+    return [statement for statement in sqlparse.parse(sql)
+            if not all(token.is_whitespace or token.ttype in Comment or token.match(Punctuation, ";")
+                       for token in statement.flatten())]
+
+
+def is_select(sql: str) -> bool:
+    statements = split_statements(sql)
+    return len(statements) == 1 and statements[0].get_type() == "SELECT"
+
+
+def iter_sql_batches(sql: str, batch_size: int = STREAM_BATCH_SIZE, shard: str | None = None):
+    """Yield (columns, rows, types) batches from a server-side cursor so memory stays bounded by batch_size.
+
+    Results small enough for the result cache are served from it and stored in it.
+    """
+    shard = get_shard(shard).name
+    cached = result_cache.get(sql, shard)
+    if cached is not None:
+        columns, rows, types = cached
+        yield columns, rows[:batch_size], types
+        for start in range(batch_size, len(rows), batch_size):
+            yield columns, rows[start:start + batch_size], types
+        return
+
+    collector = ResultCollector(result_cache, shard)
+    with get_connection(shard=shard) as conn:
+        with conn.cursor(name=f"t2t_stream_{uuid.uuid4().hex}") as cur:
+            cur.itersize = batch_size
+            with span("sql_execution"):
+                cur.execute(sql)
+                rows = cur.fetchmany(batch_size)
             columns = [desc[0] for desc in cur.description]
-            rows = cur.fetchall()
-            cur.close()
-            conn.close()
-            return columns, rows
-        else:  # For UPDATE, INSERT, etc.
-            conn.commit()
-            cur.close()
-            conn.close()
-            return [], [["Query executed successfully."]]
+            types = column_types(cur.description, rows)
+            while True:
+                collector.add(columns, rows)
+                yield columns, rows, types
+                if len(rows) < batch_size:
+                    break
+                with span("sql_execution"):
+                    rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+    collector.finish(sql, columns, types)
+
+
+def fetch_rows(sql: str, max_rows: int, shard: str | None = None) -> tuple[list, list, list, bool]:
+    """Read at most max_rows rows of a SELECT in batches and return (columns, rows, types, complete).
+
+    complete is False when rows were left unread; the rest of the result is never fetched.
+    """
+    rows = []
+    columns, types = [], []
+    batches = iter_sql_batches(sql, min(STREAM_BATCH_SIZE, max_rows + 1), shard)
+    try:
+        for columns, batch, types in batches:
+            rows.extend(batch)
+            if len(rows) > max_rows:
+                return columns, rows[:max_rows], types, False
+    finally:
+        batches.close()  # releases the connection of an abandoned server-side cursor
+    return columns, rows, types, True
+
+
+def execute_sql(sql: str, read_only: bool = READ_ONLY, statement_timeout_ms: int = STATEMENT_TIMEOUT_MS,
+                shard: str | None = None):
+    shard = get_shard(shard).name
+    select = is_select(sql)
+    if select:
+        cached = result_cache.get(sql, shard)
+        if cached is not None:
+            return cached
+
+    try:
+        with get_connection(read_only, statement_timeout_ms, shard) as conn:
+            with conn.cursor() as cur:
+                with span("sql_execution"):
+                    cur.execute(sql)
+                    rows = cur.fetchall() if cur.description else None
+
+                if cur.description:  # If the query returns rows
+                    columns = [desc[0] for desc in cur.description]
+                    types = column_types(cur.description, rows)
+                    if select:
+                        result_cache.put(sql, columns, rows, types, shard)
+                    return columns, rows, types
+                else:  # For UPDATE, INSERT, etc.
+                    conn.commit()
+                    result_cache.invalidate_for(sql, shard)
+                    return [], [["Query executed successfully."]], []
     except Exception as e:
-        return [], [[f"⚠️ Error: {str(e)}"]]
+        return [], [[f"⚠️ Error: {str(e)}"]], []
+
+
+async def execute_sql_async(sql: str, read_only: bool = READ_ONLY, statement_timeout_ms: int = STATEMENT_TIMEOUT_MS,
+                            shard: str | None = None):
+    """Run execute_sql on a worker thread so the event loop keeps serving other requests."""
+    return await asyncio.to_thread(execute_sql, sql, read_only, statement_timeout_ms, shard)
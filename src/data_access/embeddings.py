@@ -0,0 +1,158 @@
+from config import config as cfg
+
+from collections import OrderedDict
+from functools import lru_cache
+import re
+import threading
+import zlib
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_BACKEND = getattr(cfg, "EMBEDDING_BACKEND", "openai")  # "openai", "local" or "hashing"
+EMBEDDING_MODEL = getattr(cfg, "EMBEDDING_MODEL", None)  # None picks the backend's default
+EMBEDDING_BATCH_SIZE = getattr(cfg, "EMBEDDING_BATCH_SIZE", 32)  # texts per forward pass of the local model
+EMBEDDING_MAX_LENGTH = getattr(cfg, "EMBEDDING_MAX_LENGTH", 256)  # tokens; longer texts are truncated
+EMBEDDING_CACHE_SIZE = getattr(cfg, "EMBEDDING_CACHE_SIZE", 10_000)
+EMBEDDING_HASHING_DIMENSIONS = getattr(cfg, "EMBEDDING_HASHING_DIMENSIONS", 256)
+
+LOCAL_DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+
+
+class HashingEmbeddings(Embeddings):
+    """Bag-of-words embeddings from the hashing trick: deterministic and offline, for tests and benchmarks."""
+
+    model = "hashing"
+
+    def __init__(self, dimensions: int = EMBEDDING_HASHING_DIMENSIONS):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in _WORD_RE.findall(text.lower()):
+            for token in [word, *word.split("_")]:
+                h = zlib.crc32(token.encode("utf-8"))
+                vector[h % self.dimensions] += 1.0 if h & 0x80000000 else -1.0
+        vector /= np.linalg.norm(vector) or 1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+
+class LocalEmbeddings(Embeddings):
+    """Sentence embeddings from a local transformers model on CPU: mean-pooled and normalized, in batches.
+
+    The model is loaded on first use. Texts are sorted by length before batching so that
+    each batch pads to similar lengths.
+    """
+
+    def __init__(self, model_name: str = LOCAL_DEFAULT_MODEL, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 max_length: int = EMBEDDING_MAX_LENGTH):
+        self.model = model_name
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self._tokenizer = None
+        self._encoder = None
+        self._lock = threading.Lock()  # fast tokenizers are not safe to share between threads
+
+    def _load(self):
+        if self._encoder is None:
+            from transformers import AutoModel, AutoTokenizer
+
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model)
+            encoder = AutoModel.from_pretrained(self.model)
+            encoder.eval()
+            self._encoder = encoder
+
+    def _embed_batch(self, texts: list[str]) -> list[list[float]]:
+        import torch
+
+        inputs = self._tokenizer(texts, padding=True, truncation=True, max_length=self.max_length,
+                                 return_tensors="pt")
+        with torch.inference_mode():
+            hidden = self._encoder(**inputs).last_hidden_state
+        mask = inputs["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+        return torch.nn.functional.normalize(pooled, dim=1).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        with self._lock:
+            self._load()
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                for i, vector in zip(batch, self._embed_batch([texts[i] for i in batch])):
+                    vectors[i] = vector
+        return vectors
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """LRU cache of vectors in front of another Embeddings; only uncached texts reach it, in one call."""
+
+    def __init__(self, embeddings: Embeddings, max_entries: int = EMBEDDING_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", type(embeddings).__name__)
+        self.max_entries = max_entries
+        self._vectors = OrderedDict()  # (kind, text) -> vector; queries and documents may embed differently
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+            return vector
+
+    def _put(self, items):
+        with self._lock:
+            for key, vector in items:
+                self._vectors[key] = vector
+                self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        found = {}
+        for text in texts:
+            vector = self._get(("document", text))
+            if vector is not None:
+                found[text] = vector
+        missing = [text for text in dict.fromkeys(texts) if text not in found]
+        if missing:
+            vectors = self.embeddings.embed_documents(missing)
+            found.update(zip(missing, vectors))
+            self._put((("document", text), vector) for text, vector in zip(missing, vectors))
+        return [found[text] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = self._get(("query", text))
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._put([(("query", text), vector)])
+        return vector
+
+
+@lru_cache(maxsize=None)
+def get_embeddings(backend: str = EMBEDDING_BACKEND, model: str | None = EMBEDDING_MODEL) -> Embeddings:
+    """Process-wide embeddings for the configured backend, behind a CachedEmbeddings."""
+    if backend == "openai":
+        from langchain_openai import OpenAIEmbeddings
+
+        embeddings = OpenAIEmbeddings(model=model) if model else OpenAIEmbeddings()
+    elif backend == "local":
+        embeddings = LocalEmbeddings(model or LOCAL_DEFAULT_MODEL)
+    elif backend == "hashing":
+        embeddings = HashingEmbeddings()
+    else:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}; expected 'openai', 'local' or 'hashing'")
+    return CachedEmbeddings(embeddings)
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+VECTORS_FILE = "vectors.npy"
+DOCUMENTS_FILE = "documents.json"
+
+
+def _normalized(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[np.newaxis, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _matches(metadata: dict, filter) -> bool:
+    if callable(filter):
+        return filter(metadata)
+    return all(metadata.get(key) == value for key, value in filter.items())
+
+
+class NumpyVectorStore(VectorStore):
+    """Exact cosine search over a normalized float32 matrix, persisted as a memory-mapped .npy file.
+
+    A drop-in for the Chroma store at schema sizes: as_retriever() and similarity_search work
+    as before, and get/delete/add_documents/persist are the subset sync_documents uses.
+    A persisted index is opened with mmap, so only the pages a search touches are read.
+    """
+
+    def __init__(self, embedding: Embeddings, directory: str | None = None):
+        self.embedding = embedding
+        self.directory = directory
+        self._lock = threading.Lock()
+        # Searches read one (matrix, ids, texts, metadatas) snapshot; writers replace it whole
+        self._index = (np.zeros((0, 0), dtype=np.float32), [], [], [])
+        if directory is not None:
+            self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def _load(self):
+        vectors_path = os.path.join(self.directory, VECTORS_FILE)
+        documents_path = os.path.join(self.directory, DOCUMENTS_FILE)
+        if not (os.path.exists(vectors_path) and os.path.exists(documents_path)):
+            return
+        matrix = np.load(vectors_path, mmap_mode="r")
+        with open(documents_path, encoding="utf-8") as f:
+            documents = json.load(f)
+        if len(documents["ids"]) != matrix.shape[0]:
+            return  # interrupted persist; starting empty makes sync_documents re-embed everything
+        self._index = (matrix, documents["ids"], documents["texts"], documents["metadatas"])
+
+    def persist(self):
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            matrix, ids, texts, metadatas = self._index
+            suffix = f".{uuid.uuid4().hex}.tmp"
+            vectors_path = os.path.join(self.directory, VECTORS_FILE)
+            documents_path = os.path.join(self.directory, DOCUMENTS_FILE)
+            with open(vectors_path + suffix, "wb") as f:
+                np.save(f, np.ascontiguousarray(matrix))
+            with open(documents_path + suffix, "w", encoding="utf-8") as f:
+                json.dump({"ids": ids, "texts": texts, "metadatas": metadatas}, f)
+            os.replace(vectors_path + suffix, vectors_path)
+            os.replace(documents_path + suffix, documents_path)
+            # Searches that still hold the old mapping keep reading the replaced (unlinked) file
+            self._index = (np.load(vectors_path, mmap_mode="r"), ids, texts, metadatas)
+
+    def add_texts(self, texts, metadatas: list[dict] | None = None, *, ids: list[str] | None = None,
+                  **kwargs) -> list[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = [dict(metadata or {}) for metadata in metadatas] if metadatas else [{} for _ in texts]
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        vectors = _normalized(self.embedding.embed_documents(texts))
+        with self._lock:
+            matrix, old_ids, old_texts, old_metadatas = self._index
+            replaced = set(ids)
+            keep = [i for i, doc_id in enumerate(old_ids) if doc_id not in replaced]
+            if matrix.shape[0]:
+                vectors = np.concatenate([matrix[keep], vectors])
+            self._index = (
+                vectors,
+                [old_ids[i] for i in keep] + ids,
+                [old_texts[i] for i in keep] + texts,
+                [old_metadatas[i] for i in keep] + metadatas,
+            )
+        return ids
+
+    def add_documents(self, documents: list[Document], ids: list[str] | None = None, **kwargs) -> list[str]:
+        return self.add_texts([doc.page_content for doc in documents], [doc.metadata for doc in documents], ids=ids)
+
+    def delete(self, ids: list[str] | None = None, **kwargs) -> bool:
+        if not ids:
+            return False
+        removed = set(ids)
+        with self._lock:
+            matrix, old_ids, texts, metadatas = self._index
+            keep = [i for i, doc_id in enumerate(old_ids) if doc_id not in removed]
+            self._index = (matrix[keep], [old_ids[i] for i in keep], [texts[i] for i in keep],
+                           [metadatas[i] for i in keep])
+        return True
+
+    def get(self, include: list[str] | None = None, **kwargs) -> dict:
+        """Chroma-style listing: {"ids", "metadatas", "documents"}."""
+        _, ids, texts, metadatas = self._index
+        return {"ids": list(ids), "metadatas": list(metadatas), "documents": list(texts)}
+
+    def similarity_search_with_score_by_vector(self, embedding: list[float], k: int = 4, filter=None,
+                                               **kwargs) -> list[tuple[Document, float]]:
+        matrix, ids, texts, metadatas = self._index
+        if not ids:
+            return []
+        scores = matrix @ _normalized(embedding)[0]
+        if filter:
+            allowed = np.fromiter((_matches(metadata, filter) for metadata in metadatas), dtype=bool,
+                                  count=len(metadatas))
+            scores = np.where(allowed, scores, -np.inf)
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(Document(page_content=texts[i], metadata=metadatas[i]), float(scores[i]))
+                for i in top if scores[i] != -np.inf]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter=None,
+                                     **kwargs) -> list[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, filter)
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, filter=None,
+                                    **kwargs) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+
+    def similarity_search(self, query: str, k: int = 4, filter=None, **kwargs) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score  # already cosine similarity
+
+    @classmethod
+    def from_texts(cls, texts, embedding: Embeddings, metadatas: list[dict] | None = None,
+                   directory: str | None = None, ids: list[str] | None = None, **kwargs) -> "NumpyVectorStore":
+        store = cls(embedding, directory)
+        store.add_texts(texts, metadatas, ids=ids)
+        store.persist()
+        return store
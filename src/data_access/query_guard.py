@@ -0,0 +1,136 @@
+from config import config as cfg
+from src.data_access.db_executor import get_connection, is_select, split_statements, READ_ONLY
+from src.data_access.result_cache import result_cache
+from src.data_access.shards import get_shard
+from src.utils.tracing import span
+
+import logging
+
+import psycopg2
+
+logger = logging.getLogger(__name__)
+
+GUARD_ENABLED = getattr(cfg, "QUERY_GUARD_ENABLED", True)
+GUARD_MAX_COST = getattr(cfg, "QUERY_GUARD_MAX_COST", 1_000_000)  # planner cost units
+GUARD_MAX_ROWS = getattr(cfg, "QUERY_GUARD_MAX_ROWS", 100_000)  # estimated result rows
+GUARD_AUTO_LIMIT = getattr(cfg, "QUERY_GUARD_AUTO_LIMIT", 10_000)  # None rejects instead of adding a LIMIT
+GUARD_EXPLAIN_TIMEOUT_MS = getattr(cfg, "QUERY_GUARD_EXPLAIN_TIMEOUT_MS", 5000)
+
+ALLOWED = "allowed"
+LIMITED = "limited"
+REJECTED = "rejected"
+
+
+class GuardDecision:
+    """Outcome of guard_query; sql is the statement to run (rewritten when action is LIMITED)."""
+
+    def __init__(self, action: str, sql: str, estimated_cost: float | None = None,
+                 estimated_rows: int | None = None, limit: int | None = None, reason: str | None = None):
+        self.action = action
+        self.sql = sql
+        self.estimated_cost = estimated_cost
+        self.estimated_rows = estimated_rows
+        self.limit = limit
+        self.reason = reason
+
+    @property
+    def rejected(self) -> bool:
+        return self.action == REJECTED
+
+    def to_dict(self) -> dict:
+        return {
+            "action": self.action,
+            "estimated_cost": self.estimated_cost,
+            "estimated_rows": self.estimated_rows,
+            "limit": self.limit,
+            "reason": self.reason,
+        }
+
+
+def explain(sql: str, shard: str | None = None) -> tuple[float, int]:
+    """Return the planner's (total cost, estimated rows) for sql; the statement is not executed."""
+    with get_connection(read_only=True, statement_timeout_ms=GUARD_EXPLAIN_TIMEOUT_MS, shard=shard) as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"EXPLAIN (FORMAT JSON) {sql}")
+            plan = cur.fetchone()[0][0]["Plan"]
+    return plan["Total Cost"], plan["Plan Rows"]
+
+
+def limit_sql(sql: str, limit: int) -> str:
+    # Wrapping keeps the rewrite valid whatever the statement ends with (ORDER BY, an own LIMIT, UNION, ...)
+    return f"SELECT * FROM (\n{sql.strip().rstrip(';')}\n) AS limited LIMIT {int(limit)}"
+
+
+def _too_expensive(cost: float, rows: int, plot: bool = False) -> bool:
+    # A plot is downsampled before it is sent and reads at most PLOT_MAX_ROWS rows, so only its cost is bounded
+    return cost > GUARD_MAX_COST or (not plot and rows > GUARD_MAX_ROWS)
+
+
+def _narrowing_reason(cost: float, rows: int) -> str:
+    return (f"This query is estimated to cost {cost:,.0f} and return about {rows:,} rows, above the allowed "
+            f"{GUARD_MAX_COST:,} cost / {GUARD_MAX_ROWS:,} rows. Please narrow the question, e.g. with a filter, "
+            f"a time range or an aggregate.")
+
+
+def guard_query(sql: str, shard: str | None = None, plot: bool = False) -> GuardDecision:
+    """Check generated SQL before it runs.
+
+    Multiple statements, and writes in read-only mode, are rejected outright. A SELECT whose
+    EXPLAIN estimate exceeds GUARD_MAX_COST or GUARD_MAX_ROWS is wrapped in a LIMIT of
+    GUARD_AUTO_LIMIT rows when that brings it under both bounds, and rejected otherwise.
+    Queries for a plot are only held to GUARD_MAX_COST, and are rejected rather than limited:
+    the plot downsamples the full series, where a LIMIT would silently cut it short.
+    Results already in the result cache skip the EXPLAIN. SQL the planner rejects as invalid is
+    allowed, so that execution reports the error; any other EXPLAIN failure (a planning timeout,
+    a connection error) rejects the query.
+    """
+    if not GUARD_ENABLED:
+        return GuardDecision(ALLOWED, sql)
+    statements = split_statements(sql)
+    if len(statements) > 1:
+        return GuardDecision(REJECTED, sql, reason="Only a single SQL statement can be run per question.")
+    if statements:
+        sql = str(statements[0]).strip()  # drops a trailing comment, e.g. "SELECT 1;\n-- done"
+    select = is_select(sql)
+    # Unparseable SQL is left to fail at execution, which reports the database's error
+    if READ_ONLY and not select and statements and statements[0].get_type() != "UNKNOWN":
+        return GuardDecision(REJECTED, sql, reason="The database is read-only; only SELECT queries can be run.")
+
+    shard = get_shard(shard).name
+    if select and result_cache.get(sql, shard) is not None:
+        return GuardDecision(ALLOWED, sql)
+
+    with span("cost_guard"):
+        try:
+            cost, rows = explain(sql, shard)
+        except (psycopg2.ProgrammingError, psycopg2.DataError) as e:
+            # Invalid SQL (syntax errors, unknown tables or columns, bad literals) fails the same way
+            # when executed, where the error is reported
+            logger.debug("EXPLAIN failed: %s", e)
+            return GuardDecision(ALLOWED, sql)
+        except psycopg2.errors.QueryCanceled:
+            return GuardDecision(REJECTED, sql, reason=(
+                f"This query could not even be planned within {GUARD_EXPLAIN_TIMEOUT_MS:,} ms. Please narrow "
+                f"the question, e.g. with a filter, a time range or an aggregate."))
+        except Exception as e:
+            # e.g. a lost connection: a query that cannot be checked is not run
+            logger.warning("EXPLAIN failed, rejecting the query: %s", e)
+            return GuardDecision(REJECTED, sql, reason="The query could not be checked against the database. "
+                                                       "Please try again.")
+        if not _too_expensive(cost, rows, plot):
+            return GuardDecision(ALLOWED, sql, cost, rows)
+        if not select or plot or not GUARD_AUTO_LIMIT:
+            return GuardDecision(REJECTED, sql, cost, rows, reason=_narrowing_reason(cost, rows))
+
+        limited = limit_sql(sql, GUARD_AUTO_LIMIT)
+        try:
+            limited_cost, limited_rows = explain(limited, shard)
+        except Exception:
+            return GuardDecision(REJECTED, sql, cost, rows, reason=_narrowing_reason(cost, rows))
+        if _too_expensive(limited_cost, limited_rows):
+            return GuardDecision(REJECTED, sql, cost, rows, reason=_narrowing_reason(cost, rows))
+
+    logger.info("Cost guard limited a query (cost %.0f, rows %d) to %d rows", cost, rows, GUARD_AUTO_LIMIT)
+    return GuardDecision(LIMITED, limited, limited_cost, limited_rows, limit=GUARD_AUTO_LIMIT,
+                         reason=f"Estimated at about {rows:,} rows (cost {cost:,.0f}); only the first "
+                                f"{GUARD_AUTO_LIMIT:,} rows are returned.")
@@ -0,0 +1,171 @@
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import sqlparse
+from sqlparse.sql import Function, Identifier, IdentifierList, Parenthesis
+from sqlparse.tokens import DML, Keyword
+
+from config import config as cfg
+
+RESULT_CACHE_TTL_SECONDS = getattr(cfg, "RESULT_CACHE_TTL_SECONDS", 60)
+RESULT_CACHE_MAX_BYTES = getattr(cfg, "RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+RESULT_CACHE_MAX_ENTRY_BYTES = getattr(cfg, "RESULT_CACHE_MAX_ENTRY_BYTES", 8 * 1024 * 1024)
+
+# Functions, and special date/time input literals ('now', 'today', ...), whose value changes between runs
+_VOLATILE_RE = re.compile(r"\b(NOW|RANDOM|CLOCK_TIMESTAMP|STATEMENT_TIMESTAMP|TRANSACTION_TIMESTAMP|TIMEOFDAY|"
+                          r"CURRENT_TIMESTAMP|CURRENT_DATE|CURRENT_TIME|LOCALTIMESTAMP|LOCALTIME|NEXTVAL|"
+                          r"GEN_RANDOM_UUID)\b|'\s*(NOW|TODAY|TOMORROW|YESTERDAY)\s*'", re.IGNORECASE)
+_TABLE_KEYWORDS = {"FROM", "JOIN", "INTO", "UPDATE", "TABLE", "USING"}
+_SIZE_SAMPLE_ROWS = 100
+
+
+def normalize_sql(sql: str) -> str:
+    """Cache key for sql: keywords upper-cased, comments dropped and whitespace between tokens collapsed.
+
+    String literals and quoted identifiers are kept byte for byte, so 'a  b' and 'a b' stay distinct.
+    """
+    formatted = sqlparse.format(sql, keyword_case="upper", strip_comments=True)
+    parts = []
+    for statement in sqlparse.parse(formatted):
+        for token in statement.flatten():
+            if not token.is_whitespace:
+                parts.append(token.value)
+            elif parts and parts[-1] != " ":
+                parts.append(" ")
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def _collect_tables(token_list, tables: set):
+    expect_table = False
+    for token in token_list.tokens:
+        if token.is_whitespace:
+            continue
+        if token.ttype in Keyword or token.ttype in DML:
+            keyword = token.normalized
+            expect_table = keyword in _TABLE_KEYWORDS or keyword.endswith(" JOIN")
+            continue
+        if expect_table and isinstance(token, Function):  # INSERT INTO logs(a, b)
+            tables.add(token.get_real_name().lower())
+            expect_table = False
+        elif expect_table and isinstance(token, (Identifier, IdentifierList)):
+            identifiers = token.get_identifiers() if isinstance(token, IdentifierList) else [token]
+            for identifier in identifiers:
+                if not isinstance(identifier, Identifier):
+                    continue
+                if identifier.token_first() is not None and isinstance(identifier.token_first(), Parenthesis):
+                    _collect_tables(identifier.token_first(), tables)
+                elif identifier.get_real_name():
+                    tables.add(identifier.get_real_name().lower())
+            expect_table = False
+        elif token.is_group:
+            _collect_tables(token, tables)
+            expect_table = False
+
+
+def extract_tables(sql: str) -> set[str]:
+    """Return the lower-cased names of the tables a statement reads or writes (schema prefix dropped)."""
+    tables = set()
+    for statement in sqlparse.parse(sql):
+        _collect_tables(statement, tables)
+    return tables
+
+
+def estimate_size(columns: list, rows: list) -> int:
+    if not rows:
+        return sys.getsizeof(columns)
+    sample = rows[:_SIZE_SAMPLE_ROWS]
+    sample_size = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in sample)
+    return sys.getsizeof(columns) + sys.getsizeof(rows) + sample_size * len(rows) // len(sample)
+
+
+class ResultCache:
+    """TTL cache of read-only query results keyed on normalized SQL and capped by estimated memory.
+
+    Entries are scoped to a shard (database) and remember the tables they read, so a
+    write to any of those tables on the same shard evicts them.
+    """
+
+    def __init__(self, ttl_seconds: float = RESULT_CACHE_TTL_SECONDS, max_bytes: int = RESULT_CACHE_MAX_BYTES,
+                 max_entry_bytes: int = RESULT_CACHE_MAX_ENTRY_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()  # (shard, normalized sql) -> (columns, rows, types, tables, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _pop(self, key: tuple):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[4]
+
+    def get(self, sql: str, shard: str | None = None) -> tuple[list, list, list] | None:
+        key = (shard, normalize_sql(sql))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[5] < time.monotonic():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], entry[1], entry[2]
+
+    def put(self, sql: str, columns: list, rows: list, types: list, shard: str | None = None) -> bool:
+        key = (shard, normalize_sql(sql))
+        if _VOLATILE_RE.search(key[1]):
+            return False
+        size = estimate_size(columns, rows)
+        if size > self.max_entry_bytes:
+            return False
+        tables = extract_tables(key[1])
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (columns, rows, types, tables, size, time.monotonic() + self.ttl_seconds)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+        return True
+
+    def invalidate_tables(self, tables: set[str], shard: str | None = None):
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if key[0] == shard and entry[3] & tables]:
+                self._pop(key)
+
+    def invalidate_for(self, sql: str, shard: str | None = None):
+        """Evict every entry reading a table that sql writes to."""
+        self.invalidate_tables(extract_tables(sql), shard)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+class ResultCollector:
+    """Accumulates a result read batch by batch and caches it once complete, unless it outgrows the entry cap."""
+
+    def __init__(self, cache: ResultCache, shard: str | None = None):
+        self.cache = cache
+        self.shard = shard
+        self.rows = []
+        self.size = 0
+
+    def add(self, columns: list, rows: list):
+        if self.rows is None:
+            return
+        self.rows.extend(rows)
+        self.size += estimate_size(columns, rows)
+        if self.size > self.cache.max_entry_bytes:
+            self.rows = None
+
+    def finish(self, sql: str, columns: list, types: list):
+        if self.rows is not None:
+            self.cache.put(sql, columns, self.rows, types, self.shard)
+        self.rows = None
+
+
+result_cache = ResultCache()
@@ -0,0 +1,202 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from config import config as cfg
+from src.data_access.db_executor import acquire_connection, release_connection, column_types
+from src.data_access.shards import get_shard
+from src.data_access.result_cache import result_cache, ResultCollector
+from src.utils.tracing import span
+
+DEFAULT_PAGE_SIZE = getattr(cfg, "RESULT_PAGE_SIZE", 500)
+MAX_PAGE_SIZE = getattr(cfg, "RESULT_MAX_PAGE_SIZE", 10_000)
+CURSOR_IDLE_SECONDS = getattr(cfg, "RESULT_CURSOR_IDLE_SECONDS", 300)
+MAX_OPEN_CURSORS = getattr(cfg, "RESULT_CURSOR_MAX_OPEN", 4)  # each open cursor pins one pooled connection
+
+
+class CachedResultCursor:
+    """Pages over a result already held by the result cache; pins no connection."""
+
+    def __init__(self, sql: str, columns: list, rows: list, types: list):
+        self.token = uuid.uuid4().hex
+        self.sql = sql
+        self.columns = columns
+        self.types = types
+        self.rows_fetched = 0
+        self.exhausted = False
+        self.last_used = time.monotonic()
+        self.lock = threading.RLock()
+        self.row_count = len(rows)
+        self._rows = rows
+
+    def fetch_page(self, page_size: int) -> list:
+        with self.lock:
+            self.last_used = time.monotonic()
+            rows = self._rows[self.rows_fetched:self.rows_fetched + page_size]
+            self.rows_fetched += len(rows)
+            if self.rows_fetched >= len(self._rows):
+                self.close()
+            return rows
+
+    def close(self):
+        self.exhausted = True
+        self._rows = []
+
+
+class ResultCursor:
+    """A server-side (named) cursor kept open between requests so further pages can be fetched on demand.
+
+    Results that fit the result cache entry cap are cached once fully read.
+    """
+
+    def __init__(self, sql: str, shard: str):
+        self.token = uuid.uuid4().hex
+        self.sql = sql
+        self.columns = []
+        self.types = []
+        self.rows_fetched = 0
+        self.exhausted = False
+        self.last_used = time.monotonic()
+        self.lock = threading.RLock()
+        self._collector = ResultCollector(result_cache, shard)
+        self._conn = acquire_connection(shard=shard)
+        try:
+            self._cur = self._conn.cursor(name=f"t2t_page_{self.token}")
+            with span("sql_execution"):
+                self._cur.execute(sql)
+        except Exception:
+            release_connection(self._conn)
+            raise
+
+    def fetch_page(self, page_size: int) -> list:
+        with self.lock:
+            self.last_used = time.monotonic()
+            if self.exhausted:
+                return []
+            with span("sql_execution"):
+                rows = self._cur.fetchmany(page_size)
+            if not self.columns:
+                self.columns = [desc[0] for desc in self._cur.description]
+                self.types = column_types(self._cur.description, rows)
+            self.rows_fetched += len(rows)
+            self._collector.add(self.columns, rows)
+            if len(rows) < page_size:
+                self._collector.finish(self.sql, self.columns, self.types)
+                self.close()
+            return rows
+
+    def close(self):
+        with self.lock:
+            if self._conn is None:
+                return
+            self.exhausted = True
+            try:
+                self._cur.close()
+            except Exception:
+                pass
+            release_connection(self._conn)
+            self._conn = None
+
+
+_cursors = OrderedDict()
+_lock = threading.Lock()
+
+
+def _page_size(page_size: int) -> int:
+    # 0 would return an empty page with a live token and a negative size would FETCH backwards
+    return max(1, min(int(page_size), MAX_PAGE_SIZE))
+
+
+def _expire_idle():
+    now = time.monotonic()
+    for token, cursor in list(_cursors.items()):
+        if now - cursor.last_used > CURSOR_IDLE_SECONDS:
+            _cursors.pop(token).close()
+
+
+def open_cursor(sql: str, page_size: int = DEFAULT_PAGE_SIZE,
+                shard: str | None = None) -> tuple[list, list, list, str | None]:
+    """Run sql on a named cursor and return (columns, first_page, types, page_token).
+
+    page_token is None when the first page already holds every row.
+    """
+    page_size = _page_size(page_size)
+    with _lock:
+        _expire_idle()
+        while len(_cursors) >= MAX_OPEN_CURSORS:
+            _, oldest = _cursors.popitem(last=False)
+            oldest.close()
+
+    shard = get_shard(shard).name
+    cached = result_cache.get(sql, shard)
+    cursor = CachedResultCursor(sql, *cached) if cached is not None else ResultCursor(sql, shard)
+    return _first_page(cursor, page_size)
+
+
+def open_rows_cursor(sql: str, columns: list, rows: list, types: list, page_size: int = DEFAULT_PAGE_SIZE,
+                     shard: str | None = None) -> tuple[list, list, list, str | None]:
+    """Page over a result already fetched in full (e.g. to plot it); same return value as open_cursor.
+
+    The rows themselves are not kept: a result spanning several pages is paged by open_cursor,
+    from the result cache when it fits there and from a server-side cursor otherwise.
+    """
+    if len(rows) <= _page_size(page_size):
+        return columns, rows, types, None
+    return open_cursor(sql, page_size, shard)
+
+
+def _first_page(cursor, page_size: int) -> tuple[list, list, list, str | None]:
+    try:
+        # A named cursor's execute only DECLAREs it; errors such as a statement timeout surface here
+        rows = cursor.fetch_page(page_size)
+    except Exception:
+        cursor.close()  # not registered yet, so nothing else would release its connection
+        raise
+    if cursor.exhausted:
+        return cursor.columns, rows, cursor.types, None
+
+    with _lock:
+        _cursors[cursor.token] = cursor
+    return cursor.columns, rows, cursor.types, cursor.token
+
+
+def fetch_page(token: str, page_size: int = DEFAULT_PAGE_SIZE) -> tuple[list, list, list, str | None]:
+    """Fetch the next page for a token returned by open_cursor; raises KeyError for unknown or expired tokens."""
+    page_size = _page_size(page_size)
+    with _lock:
+        _expire_idle()
+        cursor = _cursors[token]
+        _cursors.move_to_end(token)
+
+    try:
+        rows = cursor.fetch_page(page_size)
+    except Exception:
+        close_cursor(token)
+        raise
+    if cursor.exhausted:
+        with _lock:
+            _cursors.pop(token, None)
+        return cursor.columns, rows, cursor.types, None
+    return cursor.columns, rows, cursor.types, token
+
+
+def cursor_row_count(token: str) -> int | None:
+    """Total rows of an open cursor whose result is held in memory; None for a server-side cursor."""
+    with _lock:
+        cursor = _cursors.get(token)
+    return cursor.row_count if isinstance(cursor, CachedResultCursor) else None
+
+
+def close_cursor(token: str):
+    with _lock:
+        cursor = _cursors.pop(token, None)
+    if cursor is not None:
+        cursor.close()
+
+
+def close_all_cursors():
+    with _lock:
+        while _cursors:
+            _, cursor = _cursors.popitem()
+            cursor.close()
@@ -1,89 +1,171 @@
 from config import config as cfg
+from src.data_access.db_executor import get_connection
+from src.utils.schema_json_util import DEFAULT_SCHEMA_NAME, qualified_name
 
-import psycopg2
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 import json
+import logging
+import os
 
-DEFAULT_SCHEMA_NAME = "public"
+logger = logging.getLogger(__name__)
 
-def get_schema_json(schema_name=DEFAULT_SCHEMA_NAME):
-    conn = psycopg2.connect(**cfg.DB_CONN_PARAMS)
-    cur = conn.cursor()
+EXTRACT_WORKERS = getattr(cfg, "SCHEMA_EXTRACT_WORKERS", 4)
+EXTRACT_TIMEOUT_MS = getattr(cfg, "SCHEMA_EXTRACT_TIMEOUT_MS", 300000)
 
-    # Get table and column info
-    cur.execute("""
-        SELECT table_name, column_name, data_type, is_nullable
-        FROM information_schema.columns
-        WHERE table_schema = %s
-        ORDER BY table_name, ordinal_position;
-    """, (schema_name,))
-    
+_RELKINDS = "('r', 'p', 'v', 'm', 'f')"  # tables, partitioned tables, views, materialized views, foreign tables
+
+# One md5 per table over its columns and PK/FK definitions; a changed signature means the table must be re-extracted
+SIGNATURES_SQL = f"""
+    SELECT c.relname,
+           md5(string_agg(a.attname || ':' || format_type(a.atttypid, NULL) || ':' || a.attnotnull, ','
+                          ORDER BY a.attnum))
+           || coalesce((SELECT md5(string_agg(pg_get_constraintdef(con.oid), ',' ORDER BY con.conname))
+                        FROM pg_catalog.pg_constraint con
+                        WHERE con.conrelid = c.oid AND con.contype IN ('p', 'f')), '')
+    FROM pg_catalog.pg_class c
+    JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    WHERE n.nspname = %s AND c.relkind IN {_RELKINDS}
+    GROUP BY c.oid, c.relname
+    ORDER BY c.relname;
+"""
+
+COLUMNS_SQL = f"""
+    SELECT c.relname, a.attname, format_type(a.atttypid, NULL), NOT a.attnotnull
+    FROM pg_catalog.pg_class c
+    JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    WHERE n.nspname = %s AND c.relkind IN {_RELKINDS}
+      AND (%s::text[] IS NULL OR c.relname = ANY(%s::text[]))
+    ORDER BY c.relname, a.attnum;
+"""
+
+# PK and FK columns; multi-column keys are paired position by position
+CONSTRAINTS_SQL = """
+    SELECT c.relname, con.contype, a.attname, fn.nspname, fc.relname, fa.attname
+    FROM pg_catalog.pg_constraint con
+    JOIN pg_catalog.pg_class c ON c.oid = con.conrelid
+    JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+    CROSS JOIN LATERAL unnest(con.conkey, con.confkey) WITH ORDINALITY AS k(attnum, fattnum, ord)
+    JOIN pg_catalog.pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+    LEFT JOIN pg_catalog.pg_class fc ON fc.oid = con.confrelid
+    LEFT JOIN pg_catalog.pg_namespace fn ON fn.oid = fc.relnamespace
+    LEFT JOIN pg_catalog.pg_attribute fa ON fa.attrelid = con.confrelid AND fa.attnum = k.fattnum
+    WHERE n.nspname = %s AND con.contype IN ('p', 'f')
+      AND (%s::text[] IS NULL OR c.relname = ANY(%s::text[]))
+    ORDER BY c.relname, con.conname, k.ord;
+"""
+
+
+def _extract_tables(cur, schema_name: str, table_names: list[str] | None) -> dict:
+    cur.execute(COLUMNS_SQL, (schema_name, table_names, table_names))
     tables = {}
+    column_index = {}
     for table_name, column_name, data_type, is_nullable in cur.fetchall():
         if table_name not in tables:
             tables[table_name] = {"columns": []}
-        tables[table_name]["columns"].append({
+        col = {
             "name": column_name,
             "type": data_type,
-            "nullable": is_nullable == "YES"
-        })
-
-    # Get primary keys
-    cur.execute("""
-        SELECT
-            kcu.table_name, kcu.column_name
-        FROM information_schema.table_constraints tc
-        JOIN information_schema.key_column_usage kcu
-            ON tc.constraint_name = kcu.constraint_name
-        WHERE tc.constraint_type = 'PRIMARY KEY'
-        AND tc.table_schema = %s;
-    """, (schema_name,))
-    for table_name, column_name in cur.fetchall():
-        for col in tables[table_name]["columns"]:
-            if col["name"] == column_name:
-                col["is_primary"] = True
-
-    # Get foreign keys
-    cur.execute("""
-        SELECT
-            kcu.table_name, kcu.column_name,
-            ccu.table_name AS foreign_table,
-            ccu.column_name AS foreign_column
-        FROM information_schema.table_constraints tc
-        JOIN information_schema.key_column_usage kcu
-            ON tc.constraint_name = kcu.constraint_name
-        JOIN information_schema.constraint_column_usage ccu
-            ON ccu.constraint_name = tc.constraint_name
-        WHERE tc.constraint_type = 'FOREIGN KEY'
-        AND tc.table_schema = %s;
-    """, (schema_name,))
-    
-    relationships = []
-    for table, column, ref_table, ref_column in cur.fetchall():
-        for col in tables[table]["columns"]:
-            if col["name"] == column:
-                col["is_foreign"] = True
-                col["references"] = f"{ref_table}.{ref_column}"
-        relationships.append({
-            "from": f"{table}.{column}",
-            "to": f"{ref_table}.{ref_column}",
-            "type": "many-to-one"
-        })
-
-    schema_json = {
+            "nullable": is_nullable
+        }
+        tables[table_name]["columns"].append(col)
+        column_index[(table_name, column_name)] = col
+
+    cur.execute(CONSTRAINTS_SQL, (schema_name, table_names, table_names))
+    for table_name, contype, column_name, ref_schema, ref_table, ref_column in cur.fetchall():
+        col = column_index.get((table_name, column_name))
+        if col is None:
+            continue
+        if contype == "p":
+            col["is_primary"] = True
+        else:
+            col["is_foreign"] = True
+            col["references"] = f"{qualified_name(ref_schema, ref_table)}.{ref_column}"
+    return tables
+
+
+def _relationships(schema_name: str, tables: list[dict]) -> list[dict]:
+    return [
+        {"from": f"{qualified_name(schema_name, table['name'])}.{col['name']}", "to": col["references"],
+         "type": "many-to-one"}
+        for table in tables
+        for col in table["columns"]
+        if col.get("is_foreign")
+    ]
+
+
+def get_schema_json(schema_name=DEFAULT_SCHEMA_NAME, previous: dict | None = None, shard: str | None = None):
+    """Extract one schema from pg_catalog.
+
+    With previous (an earlier output of this function), only tables whose
+    signature changed are re-extracted; the others are copied from previous.
+    """
+    with get_connection(read_only=True, statement_timeout_ms=EXTRACT_TIMEOUT_MS, shard=shard) as conn:
+        with conn.cursor() as cur:
+            cur.execute(SIGNATURES_SQL, (schema_name,))
+            signatures = dict(cur.fetchall())
+
+            previous_tables = {}
+            changed = None
+            if previous:
+                previous_signatures = previous.get("signatures", {})
+                previous_tables = {table["name"]: table for table in previous.get("tables", [])}
+                changed = [name for name, signature in signatures.items()
+                           if name not in previous_tables or previous_signatures.get(name) != signature]
+
+            extracted = _extract_tables(cur, schema_name, changed) if changed != [] else {}
+
+    tables = [
+        {"name": name, **extracted[name]} if name in extracted else previous_tables[name]
+        for name in signatures
+        if name in extracted or name in previous_tables
+    ]
+    if previous:
+        logger.info("%s: %d tables re-extracted, %d unchanged", schema_name, len(extracted), len(tables) - len(extracted))
+
+    return {
         "schema": schema_name,
-        "tables": [{"name": name, **info} for name, info in tables.items()],
-        "relationships": relationships
+        "tables": tables,
+        "relationships": _relationships(schema_name, tables),
+        "signatures": signatures
     }
 
-    cur.close()
-    conn.close()
 
-    return schema_json
+def get_schemas_json(schema_names: list[str], previous: dict | None = None, shard: str | None = None) -> dict:
+    """Extract several schemas concurrently; previous maps schema name -> earlier schema JSON."""
+    previous = previous or {}
+    with ThreadPoolExecutor(max_workers=min(EXTRACT_WORKERS, len(schema_names)) or 1) as executor:
+        futures = {name: executor.submit(get_schema_json, name, previous.get(name), shard) for name in schema_names}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def schema_json_path(schema_name: str, database: str | None = None) -> str:
+    prefix = f"{database}_" if database else ""
+    return os.path.join(cfg.SCHEMA_JSON_DIR, f"{prefix}{schema_name}_schema.json")
+
+
+def _load_previous(schema_name: str, database: str | None = None) -> dict | None:
+    path = schema_json_path(schema_name, database)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
 
 
 if __name__ == "__main__":
-    schema = get_schema_json()
-    json_path = f"{cfg.SCHEMA_JSON_DIR}/{DEFAULT_SCHEMA_NAME}_schema.json"
-    with open(f'{DEFAULT_SCHEMA_NAME}_schema.json', "w") as f:
-        json.dump(schema, f, indent=2)
-    print(f'{DEFAULT_SCHEMA_NAME}_schema.json')
+    parser = argparse.ArgumentParser(description="Extract database schemas to SCHEMA_JSON_DIR")
+    parser.add_argument("schemas", nargs="*", default=[DEFAULT_SCHEMA_NAME])
+    parser.add_argument("--incremental", action="store_true",
+                        help="only re-extract tables that changed since the existing JSON was written")
+    parser.add_argument("--database", help="a name from DATABASES to connect to instead of DB_CONN_PARAMS")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    previous = {name: _load_previous(name, args.database) for name in args.schemas} if args.incremental else None
+    for name, schema in get_schemas_json(args.schemas, previous, args.database).items():
+        json_path = schema_json_path(name, args.database)
+        with open(json_path, "w") as f:
+            json.dump(schema, f, indent=2)
+        print(json_path)
@@ -0,0 +1,79 @@
+from config import config as cfg
+from config.config import DB_CONN_PARAMS, SCHEMA_JSON_DIR
+
+import os
+import re
+import threading
+
+
+DEFAULT_SHARD_NAME = "default"
+
+
+class Shard:
+    """One database target: its schema JSON, its connection parameters and its vectorstore collection."""
+
+    def __init__(self, name: str, schema_path: str | None, conn_params: dict):
+        self.name = name
+        self.schema_path = schema_path
+        self.conn_params = conn_params
+        # Chroma collection names: 3-63 characters from [a-zA-Z0-9._-]
+        self.collection_name = ("schema_" + re.sub(r"[^a-zA-Z0-9._-]", "_", name))[:63]
+
+
+_shards = None
+_default_shard = None
+_lock = threading.Lock()
+
+
+def _load_shards() -> tuple[dict, str]:
+    """Shards come from cfg.DATABASES when set:
+
+        DATABASES = {"sales": {"schema_file": "sales_schema.json", "conn_params": {...}}, ...}
+
+    (conn_params defaults to DB_CONN_PARAMS). Otherwise every JSON file in
+    SCHEMA_JSON_DIR is a shard named after the file, on DB_CONN_PARAMS; with no
+    JSON yet (e.g. before the first schema extraction) there is a single shard
+    without a schema file.
+    """
+    databases = getattr(cfg, "DATABASES", None)
+    if databases:
+        shards = {
+            name: Shard(name, os.path.join(SCHEMA_JSON_DIR, spec["schema_file"]),
+                        spec.get("conn_params", DB_CONN_PARAMS))
+            for name, spec in databases.items()
+        }
+    else:
+        json_files = sorted(f for f in os.listdir(SCHEMA_JSON_DIR) if f.endswith(".json")) \
+            if os.path.isdir(SCHEMA_JSON_DIR) else []
+        shards = {
+            os.path.splitext(f)[0]: Shard(os.path.splitext(f)[0], os.path.join(SCHEMA_JSON_DIR, f), DB_CONN_PARAMS)
+            for f in json_files
+        } or {DEFAULT_SHARD_NAME: Shard(DEFAULT_SHARD_NAME, None, DB_CONN_PARAMS)}
+    default = getattr(cfg, "DEFAULT_DATABASE", None) or next(iter(shards))
+    return shards, default
+
+
+def get_shards() -> dict:
+    global _shards, _default_shard
+    with _lock:
+        if _shards is None:
+            _shards, _default_shard = _load_shards()
+        return _shards
+
+
+def reload_shards() -> dict:
+    global _shards
+    with _lock:
+        _shards = None
+    return get_shards()
+
+
+def default_shard_name() -> str:
+    get_shards()
+    return _default_shard
+
+
+def get_shard(name: str | None = None) -> Shard:
+    """Return the named shard, or the default one; raises KeyError for unknown names."""
+    shards = get_shards()
+    return shards[name or _default_shard]
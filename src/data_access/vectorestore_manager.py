@@ -1,15 +1,21 @@
+from config import config as cfg
 from config.config import VECTORSTORE_DIR
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_openai import OpenAIEmbeddings
 from langchain.schema import Document
-from src.utils.schema_json_util import load_schema_json, flatten_table
+from src.data_access.embeddings import EMBEDDING_BACKEND, get_embeddings
+from src.data_access.numpy_vectorstore import NumpyVectorStore
+from src.utils.schema_json_util import get_schema_cache
+from src.data_access.shards import get_shard
 
-from config.config import SCHEMA_JSON_DIR
-import json
+import hashlib
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
+VECTORSTORE_BACKEND = getattr(cfg, "VECTORSTORE_BACKEND", "chroma")  # "chroma" or "numpy"
+
 
 def add_info_schema(vectordb):
     info_schema_doc = Document(
@@ -28,17 +34,10 @@ def add_info_schema(vectordb):
 
     return vectordb
 
-def get_schema_documents() -> list[Document]:
-    docs = []
-    for file in os.listdir(SCHEMA_JSON_DIR):
-        if file.endswith(".json"):
-            schema = load_schema_json(os.path.join(SCHEMA_JSON_DIR, file))
-            for table in schema.get("tables", []):
-                text = flatten_table(table)
-                table_name = table['name']
-                docs.append(Document(page_content=text, metadata={"id": f"table_{table_name}"}))
-            break  # handle only one file for now
-    return docs
+def get_schema_documents(shard: str | None = None) -> list[Document]:
+    table_texts = get_schema_cache(shard).get().table_texts
+    return [Document(page_content=text, metadata={"id": f"table_{table_name}"})
+            for table_name, text in table_texts.items()]
 
 def add_info_schema_docs() -> list[Document]:
     info_text = """Table: information_schema.tables
@@ -52,24 +51,81 @@ def add_info_schema_docs() -> list[Document]:
     return [Document(page_content=info_text, metadata={"id": "info_schema"})]
 
 
-def create_vectorstore_from_schema():
-    docs = get_schema_documents()
+def _content_hash(doc: Document, embedding_model: str) -> str:
+    return hashlib.sha256(f"{embedding_model}\n{doc.page_content}".encode("utf-8")).hexdigest()
+
+
+def sync_documents(vectorstore, docs: list[Document], embedding_model: str = ""):
+    """Make the persisted collection match docs, embedding only new or changed documents.
+
+    Documents are stored under their metadata id with a content hash, so unchanged
+    documents are skipped and documents that are no longer present are deleted.
+    """
+    existing = vectorstore.get(include=["metadatas"])
+    existing_hashes = {
+        doc_id: (meta or {}).get("content_hash")
+        for doc_id, meta in zip(existing["ids"], existing["metadatas"])
+    }
+
+    wanted = {}
+    for doc in docs:
+        doc.metadata["content_hash"] = _content_hash(doc, embedding_model)
+        wanted[doc.metadata["id"]] = doc
+
+    stale_ids = [doc_id for doc_id in existing_hashes if doc_id not in wanted]
+    changed = [doc for doc_id, doc in wanted.items()
+               if existing_hashes.get(doc_id) != doc.metadata["content_hash"]]
+
+    replaced_ids = [doc.metadata["id"] for doc in changed if doc.metadata["id"] in existing_hashes]
+    if stale_ids or replaced_ids:
+        vectorstore.delete(ids=stale_ids + replaced_ids)
+    if changed:
+        vectorstore.add_documents(changed, ids=[doc.metadata["id"] for doc in changed])
+
+    logger.info("Vectorstore sync: %d embedded, %d removed, %d unchanged",
+                len(changed), len(stale_ids), len(wanted) - len(changed))
+    return vectorstore
+
+
+def collection_name(shard: str | None, embedding_model: str) -> str:
+    # A collection holds vectors of one dimension, so other embedding models get their own collection
+    name = get_shard(shard).collection_name
+    if EMBEDDING_BACKEND == "openai":
+        return name
+    return f"{name}_{hashlib.sha256(embedding_model.encode('utf-8')).hexdigest()[:8]}"
+
+
+def sync_with_schema(vectorstore, shard: str | None = None):
+    """Sync an open vectorstore with the shard's current schema, e.g. after the schema changed."""
+    docs = get_schema_documents(shard)
     docs += add_info_schema_docs()
-    
-    embeddings = OpenAIEmbeddings()  # set API key via env var or manually
-    vectorstore = Chroma.from_documents(
-        documents=docs,
-        embedding=embeddings,
-        persist_directory=VECTORSTORE_DIR,
-    )
+    sync_documents(vectorstore, docs, embedding_model=getattr(vectorstore.embeddings, "model", ""))
     vectorstore.persist()
     return vectorstore
 
 
+def create_vectorstore_from_schema(shard: str | None = None):
+    """Open the shard's persisted collection and sync it with the shard's schema."""
+    embeddings = get_embeddings()
+    name = collection_name(shard, embeddings.model)
+    if VECTORSTORE_BACKEND == "numpy":
+        vectorstore = NumpyVectorStore(embeddings, os.path.join(VECTORSTORE_DIR, "numpy", name))
+    else:
+        from langchain_community.vectorstores import Chroma
+
+        vectorstore = Chroma(
+            collection_name=name,
+            embedding_function=embeddings,
+            persist_directory=VECTORSTORE_DIR,
+        )
+    return sync_with_schema(vectorstore, shard)
+
+
 def create_vectorstore_from_text(text: str, persist_dir: str = VECTORSTORE_DIR):
+    from langchain_community.vectorstores import Chroma
+
     splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=100)
     docs = splitter.create_documents([text])
-    embeddings = OpenAIEmbeddings()
-    vectordb = Chroma.from_documents(docs, embeddings, persist_directory=persist_dir)
+    vectordb = Chroma.from_documents(docs, get_embeddings(), persist_directory=persist_dir)
     vectordb = add_info_schema(vectordb)
     return vectordb
@@ -1,9 +1,95 @@
+from config import config as cfg
+from src.data_access.shards import get_shard
 
-vectorstore = None
+from collections import OrderedDict
+import logging
+import threading
 
-def get_vectorstore():
+logger = logging.getLogger(__name__)
+
+MAX_RESIDENT_SHARDS = getattr(cfg, "MAX_RESIDENT_SHARDS", 4)
+
+_vectorstores = OrderedDict()  # shard name -> vectorstore, least recently used first
+_lock = threading.Lock()
+_init_locks = {}
+_synced_versions = {}  # shard name -> schema version its resident vectorstore was last synced with
+_eviction_listeners = []  # called with (shard name, vectorstore) when a shard is evicted
+
+
+def add_eviction_listener(listener):
+    """Register a callable to drop whatever else keeps an evicted shard's vectorstore alive."""
+    _eviction_listeners.append(listener)
+
+
+def _release_shard(name: str, vectorstore):
+    """Free what an evicted shard holds besides its index: its schema snapshot and connection pool."""
+    from src.data_access.db_executor import close_shard_pool
+    from src.utils.schema_json_util import drop_schema_cache
+
+    for listener in _eviction_listeners:
+        listener(name, vectorstore)
+    _synced_versions.pop(name, None)
+    drop_schema_cache(name)
+    close_shard_pool(name)
+
+def get_vectorstore(shard: str | None = None):
+    """Return the shard's vectorstore if it is resident, without building it."""
+    name = get_shard(shard).name
+    with _lock:
+        vectorstore = _vectorstores.get(name)
+        if vectorstore is not None:
+            _vectorstores.move_to_end(name)
+        return vectorstore
+
+def set_vectorstore(vstore, shard: str | None = None):
+    name = get_shard(shard).name
+    evicted = []
+    with _lock:
+        _vectorstores[name] = vstore
+        _vectorstores.move_to_end(name)
+        while len(_vectorstores) > MAX_RESIDENT_SHARDS:
+            evicted.append(_vectorstores.popitem(last=False))
+    for evicted_name, evicted_vectorstore in evicted:
+        logger.info("Vectorstore for shard %s evicted", evicted_name)
+        _release_shard(evicted_name, evicted_vectorstore)
+
+def _schema_version(name: str) -> str:
+    from src.utils.schema_json_util import get_schema_cache
+
+    return get_schema_cache(name).get().version
+
+
+def init_vectorstore(shard: str | None = None):
+    """Return the shard's vectorstore, building (or reopening) it on first use; FastAPI and Gradio share it.
+
+    A resident vectorstore is re-synced when the shard's schema has changed since it was last
+    synced, so retrieval follows schema reloads. At most MAX_RESIDENT_SHARDS shard indexes stay
+    loaded; the least recently used is dropped first.
+    """
+    name = get_shard(shard).name
+    # Read before syncing: a schema that changes during the sync is picked up by the next call
+    version = _schema_version(name)
+    vectorstore = get_vectorstore(name)
+    if vectorstore is not None and _synced_versions.get(name) == version:
+        return vectorstore
+
+    with _lock:
+        init_lock = _init_locks.setdefault(name, threading.Lock())
+    with init_lock:
+        vectorstore = get_vectorstore(name)
+        if vectorstore is None:
+            from src.data_access.vectorestore_manager import create_vectorstore_from_schema
+            vectorstore = create_vectorstore_from_schema(name)
+            set_vectorstore(vectorstore, name)
+        elif _synced_versions.get(name) != version:
+            from src.data_access.vectorestore_manager import sync_with_schema
+            logger.info("Schema of shard %s changed; re-syncing its vectorstore", name)
+            sync_with_schema(vectorstore, name)
+        _synced_versions[name] = version
     return vectorstore
 
-def set_vectorstore(vstore):
-    global vectorstore
-    vectorstore = vstore
\ No newline at end of file
+
+def refresh_vectorstore(shard: str | None = None):
+    """Re-sync the shard's vectorstore with its schema now if it is resident; others sync when built."""
+    if get_vectorstore(shard) is not None:
+        init_vectorstore(shard)
@@ -1,38 +1,50 @@
 
-from src.utils.schema_json_util import load_schema_json, flatten_schema
-from src.data_access.vectorestore_manager import create_vectorstore_from_text
-from src.services.retriever_chain import get_qa_chain
+from src.utils.schema_json_util import get_schema_cache
+from src.data_access.vectorstore_singleton import init_vectorstore
+from src.services.shard_router import route_question
+from src.services.retriever_chain import get_qa_chain, DEFAULT_MODEL
+from src.services.llm_clients import call_llm
+from src.services.llm_callbacks import TracingCallback
 from src.utils.load_api_key import load_api_key
-from src.data_access.db_executor import execute_sql
-from src.services.llm_ambiguity_checker import check_ambiguity
-from src.utils.schema_json_util import flatten_schema
-from src.utils.visualizer import plot_with_plotly
+from config import config as cfg
+from src.data_access.db_executor import execute_sql, fetch_rows, is_select
+from src.data_access.result_cursor import open_cursor, open_rows_cursor, close_cursor, cursor_row_count, fetch_page
+from src.data_access.query_guard import guard_query, LIMITED
+from src.services.llm_ambiguity_checker import check_ambiguity, build_schema_context
+from src.services.ambiguity_index import get_ambiguity_index
+from src.utils.visualizer import build_figure_spec, PLOT_MAX_ROWS
+from src.utils.tracing import configure_logging
 
 import gradio as gr
+import plotly.graph_objects as go
 import re
 import json
-import traceback
-import os
-import subprocess
-
-MOCK_MODE = False
+import logging
 
+logger = logging.getLogger(__name__)
 
-def start_static_server():
-    static_dir = os.path.abspath("static")
-    subprocess.Popen(["python", "-m", "http.server", "7861", "--directory", static_dir])
+MOCK_MODE = False
+TABLE_PAGE_SIZE = getattr(cfg, "GRADIO_PAGE_SIZE", 100)
 
 
 def strip_sql_markdown(text: str) -> str:
     return re.sub(r"^```sql\s*|^```\s*|```$", "", text.strip(), flags=re.MULTILINE).strip()
 
 
-def load_schema() -> tuple:
-    schema = load_schema_json("public_schema.json")
-    schema_text = flatten_schema(schema)
-    return schema, schema_text
-
-def check_for_ambiguity(message: str, schema_text: str) -> str | None:
+def warm_up():
+    """Load the API key, schema cache and the default database's vectorstore once, before the first message."""
+    configure_logging()
+    load_api_key()
+    get_schema_cache().get()
+    init_vectorstore()
+
+def check_for_ambiguity(message: str, shard: str | None = None) -> str | None:
+    # Only ask the LLM when the question touches a name shared by several tables
+    snapshot = get_schema_cache(shard).get()
+    collisions = get_ambiguity_index(snapshot).find_collisions(message)
+    if not collisions:
+        return None
+    schema_text = build_schema_context(message, snapshot.table_texts, collisions, init_vectorstore(shard))
     ambiguity = check_ambiguity(message, schema_text)
     if ambiguity.get("ambiguous"):
         clarify_items = ambiguity.get("clarify", [])
@@ -57,55 +69,117 @@ def get_llm_generated_query(message: str, vectorstore) -> dict:
             "chart_type": "line"
         }
 
-    chain = get_qa_chain(vectorstore)
-    result = chain.invoke({"query": message})
-    print("LLM result:\n", result["result"])
+    chain = get_qa_chain(vectorstore, DEFAULT_MODEL)
+    result = call_llm(DEFAULT_MODEL, chain.invoke, {"query": message}, config={"callbacks": [TracingCallback()]})
+    logger.debug("LLM result: %s", result["result"])
     return json.loads(result["result"])
 
-def execute_sql_and_plot(sql: str, plot: bool, x_axis: str, y_axis: str, chart_type: str) -> tuple[str | None, str | None]:
+def format_total(table: dict) -> str:
+    if table["total"] is None:
+        return "?"
+    return f"about {table['total']:,}" if table["estimated"] else f"{table['total']:,}"
+
+
+def table_caption(table: dict) -> str:
+    end = table["start"] + len(table["rows"])
+    return f"Rows {table['start'] + min(1, end):,}–{end:,} of {format_total(table)}"
+
+
+def next_table_page(table: dict) -> dict:
+    """Return the page after table, read from its server-side cursor or cached result."""
+    try:
+        columns, rows, _, token = fetch_page(table["cursor"], TABLE_PAGE_SIZE)
+    except KeyError:  # idle cursor expired or evicted
+        return {**table, "cursor": None}
+    start = table["start"] + len(table["rows"])
+    if token is None:  # last page: the total is now known exactly
+        return {"columns": columns, "rows": rows, "cursor": None, "start": start,
+                "total": start + len(rows), "estimated": False}
+    return {**table, "columns": columns, "rows": rows, "cursor": token, "start": start}
+
+
+def execute_sql_and_plot(sql: str, plot: bool, x_axis: str, y_axis: str, chart_type: str,
+                         shard: str | None = None) -> tuple[str | None, go.Figure | None, dict | None]:
+    """Run sql and return (message, figure, table).
+
+    table is the first page of a SELECT: {"columns", "rows", "cursor", "start", "total", "estimated"},
+    where cursor (None once every row was shown) is passed to next_table_page for the following page.
+    total is exact when the whole result is known; while a server-side cursor is open it is the cost
+    guard's row estimate (estimated is True), or None.
+    """
     clean_sql = strip_sql_markdown(sql)
-    columns, rows = execute_sql(clean_sql)
+    decision = guard_query(clean_sql, shard, plot)
+    if decision.rejected:
+        return f"⚠️ Query rejected: {decision.reason}", None, None
+    clean_sql = decision.sql
+    fetched_all = False
+    complete = True
+    if is_select(clean_sql):
+        try:
+            if plot:
+                columns, rows, types, complete = fetch_rows(clean_sql, PLOT_MAX_ROWS, shard)
+                fetched_all = True
+            else:
+                columns, rows, _, page_token = open_cursor(clean_sql, TABLE_PAGE_SIZE, shard)
+        except Exception as e:
+            columns, rows, page_token = [], [[f"⚠️ Error: {str(e)}"]], None
+    else:
+        columns, rows, types = execute_sql(clean_sql, shard=shard)
+        fetched_all = True
 
     if not columns:
-        return rows[0][0], None
+        return rows[0][0], None, None
 
     if plot and x_axis in columns and y_axis in columns:
         try:
-            web_path = plot_with_plotly(columns, rows, x_axis, y_axis, chart_type)
-            iframe_html = f"""
-                <iframe src="{web_path}" width="100%" height="500px" style="border:none;"></iframe>
-            """
-            print(web_path, iframe_html)
-            return None, iframe_html
+            spec = build_figure_spec(columns, rows, x_axis, y_axis, chart_type)
+            if not complete:
+                spec["layout"]["title"] = {"text": f"First {PLOT_MAX_ROWS:,} rows"}
+            return None, go.Figure(spec), None
         except Exception as e:
-            traceback.print_exc()
-            return f"⚠️ Failed to generate plot: {e}", None
+            logger.exception("Failed to generate plot")
+            return f"⚠️ Failed to generate plot: {e}", None, None
 
-    # Fallback: generate markdown table
-    table_md = "| " + " | ".join(columns) + " |\n"
-    table_md += "| " + " | ".join(["---"] * len(columns)) + " |\n"
-    for row in rows:
-        table_md += "| " + " | ".join(map(str, row)) + " |\n"
-    return f"**Assistant:**\n{table_md}", None
+    if fetched_all:
+        # e.g. a plot whose axes are not in the result: page over the rows already fetched
+        total = len(rows) if complete else None
+        try:
+            columns, rows, _, page_token = open_rows_cursor(clean_sql, columns, rows, types, TABLE_PAGE_SIZE, shard)
+        except Exception:
+            logger.exception("Could not open a cursor over the result")
+            rows, page_token = rows[:TABLE_PAGE_SIZE], None
+    else:
+        total = None if page_token else len(rows)
+    estimated = False
+    if total is None and page_token is not None:
+        total = cursor_row_count(page_token)  # a result served from the result cache
+        if total is None:
+            total, estimated = decision.estimated_rows, True
+    table = {"columns": columns, "rows": rows, "cursor": page_token, "start": 0, "total": total,
+             "estimated": estimated}
+    message = f"**Assistant:** {format_total(table)} rows" if total is not None else "**Assistant:** Query results"
+    message += ", shown in the table below."
+    if decision.action == LIMITED:
+        message += f"\n\n_{decision.reason}_"
+    return message, None, table
 
 
 def chat_with_sql_bot(message, history):
-    load_api_key()
-    schema, schema_text = load_schema()
+    shard = route_question(message)
 
     # Step 1: Check ambiguity
     if not MOCK_MODE:
-        ambiguity_msg = check_for_ambiguity(message, schema_text)
+        ambiguity_msg = check_for_ambiguity(message, shard)
         if ambiguity_msg:
-            return ambiguity_msg, None
+            return ambiguity_msg, None, None
 
     # Step 2: Query generation
-    vectorstore = create_vectorstore_from_text(schema_text)
+    vectorstore = init_vectorstore(shard)
     try:
         parsed = get_llm_generated_query(message, vectorstore)
     except Exception as e:
-        traceback.print_exc()
-        return f"⚠️ Failed to parse assistant response: {e}", None
+        logger.exception("Failed to parse assistant response")
+        return f"⚠️ Failed to parse assistant response: {e}", None, None
 
     # Step 3: SQL execution + plot or table
     return execute_sql_and_plot(
@@ -113,36 +187,54 @@ def chat_with_sql_bot(message, history):
         parsed.get("plot", False),
         parsed.get("x_axis", ""),
         parsed.get("y_axis", ""),
-        parsed.get("chart_type", "bar")
+        parsed.get("chart_type", "bar"),
+        shard
     )
 
     
 
 
 if __name__ == "__main__":
-    start_static_server()
+    warm_up()
     with gr.Blocks() as demo:
         chatbot = gr.Chatbot(height=550)
         user_input = gr.Textbox(placeholder="Ask a question in natural language...", lines=1, label="Query")
-        html_plot = gr.HTML(visible=False)
+        plot_output = gr.Plot(visible=False)
+        table_caption_output = gr.Markdown(visible=False)
+        table_output = gr.Dataframe(visible=False, interactive=False, wrap=True)
+        next_page_button = gr.Button("Next page", visible=False)
+        table_state = gr.State(None)
+
+        def table_updates(table):
+            if table is None:
+                return gr.update(visible=False), gr.update(visible=False), gr.update(visible=False), None
+            return (gr.update(value=table_caption(table), visible=True),
+                    gr.update(value={"headers": table["columns"], "data": table["rows"]}, visible=True),
+                    gr.update(visible=table["cursor"] is not None), table)
+
+        def handle_query(message, history, previous_table):
+            if previous_table and previous_table["cursor"]:
+                close_cursor(previous_table["cursor"])  # frees the connection pinned by an unfinished result
 
-        def handle_query(message, history):
-            
             history = history + [(message, None)]
 
-            table_output, plot_html = chat_with_sql_bot(message, [])
+            reply, figure, table = chat_with_sql_bot(message, [])
 
-            if table_output:
-                history[-1] = (message, table_output)
+            if reply:
+                history[-1] = (message, reply)
             else:
                 history[-1] = (message, "✅ Plot generated below ⬇️")
 
-            html_update = gr.update(value=plot_html, visible=bool(plot_html))
-            chat_update = [] if table_output is None else [(message, table_output)]
+            plot_update = gr.update(value=figure, visible=figure is not None)
+            return (history, plot_update, *table_updates(table), "")
 
-            return history, html_update, ""
+        def handle_next_page(table):
+            return table_updates(next_table_page(table) if table and table["cursor"] else table)
 
-        user_input.submit(handle_query, inputs=[user_input, chatbot], outputs=[chatbot, html_plot, user_input])
+        table_outputs = [table_caption_output, table_output, next_page_button, table_state]
+        user_input.submit(handle_query, inputs=[user_input, chatbot, table_state],
+                          outputs=[chatbot, plot_output, *table_outputs, user_input])
+        next_page_button.click(handle_next_page, inputs=[table_state], outputs=table_outputs)
 
     demo.launch()
 
@@ -1,22 +1,58 @@
-from src.data_access.vectorestore_manager import create_vectorstore_from_schema
-from src.data_access.vectorstore_singleton import set_vectorstore
-from src.services.handle_query import handle_query
+from src.data_access.vectorstore_singleton import init_vectorstore, refresh_vectorstore
+from src.data_access.db_executor import close_pool
+from src.data_access.result_cursor import close_all_cursors, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from src.services.handle_query import handle_query, handle_page, handle_query_stream
+from src.services.conversation_sessions import conversation_sessions
+from src.services.ambiguity_index import get_ambiguity_index
+from src.services.llm_clients import get_openai_client
+from src.services.retriever_chain import get_qa_chain, DEFAULT_MODEL
 from src.utils.load_api_key import load_api_key
+from src.utils.schema_json_util import get_schema_cache
+from src.data_access.shards import get_shard, reload_shards
+from src.utils.response_encoding import dumps, encode_response, negotiate_format
+from src.utils.tracing import (REQUEST_SECONDS, TIMING_HEADERS, configure_logging, server_timing_header, span,
+                               start_timings, stop_logging)
 from config.config import SCHEMA_JSON_DIR
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from contextlib import asynccontextmanager
-from pydantic import BaseModel
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from pydantic import BaseModel, Field
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    """Load what the first question needs: the default database's schema, vectorstore and chain, and the LLM client.
+
+    The other databases load on their first question.
+    """
+    snapshot = get_schema_cache().get()
+    get_ambiguity_index(snapshot)
+    get_qa_chain(init_vectorstore(), DEFAULT_MODEL)
+    get_openai_client()
+
+
+def _start_warm_up(app: FastAPI):
+    app.state.warm_up = asyncio.create_task(asyncio.to_thread(warm_up))
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    configure_logging()
     load_api_key()
-    # schema, schema_text = load_schema()
-    vectorstore = create_vectorstore_from_schema()
-    set_vectorstore(vectorstore)
+    # Warm up in the background so the server accepts traffic (and answers /healthz) straight away;
+    # /readyz reports when it is done. Questions asked before then load what they need themselves.
+    _start_warm_up(app)
     yield
+    close_all_cursors()
+    close_pool()
+    stop_logging()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -25,15 +61,104 @@ app.add_middleware(
     allow_origins=["*"],  # You can tighten this later
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
-load_api_key()
+
+@app.middleware("http")
+async def timing_middleware(request: Request, call_next):
+    timings = start_timings()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    REQUEST_SECONDS.labels(getattr(route, "path", "unmatched"), response.status_code).observe(elapsed)
+    if TIMING_HEADERS:
+        # Streamed responses only cover the stages finished before the first line was sent
+        response.headers["Server-Timing"] = server_timing_header(timings, elapsed)
+    return response
+
 class QueryRequest(BaseModel):
     query: str
-    history: list[dict] = [] # [{'user': '...', 'bot': '...'}, ...]
+    history: list[dict] = [] # [{'user': '...', 'bot': '...'}, ...]; prefer session_id
+    session_id: str | None = None  # returned by the previous answer; the conversation is kept server-side
+    stream: bool = False  # stream NDJSON: a header line, then one line per row batch
+    page_size: int = Field(DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE)
+    format: str | None = None  # "rows" (default), "columnar" or "arrow"; otherwise taken from the Accept header
+    database: str | None = None  # a shard name; routed from the question when omitted
+
+class PageRequest(BaseModel):
+    cursor: str
+    page_size: int = Field(DEFAULT_PAGE_SIZE, gt=0, le=MAX_PAGE_SIZE)
+    format: str | None = None
+
+
+def _response_format(requested: str | None, http_request: Request) -> str:
+    try:
+        return negotiate_format(requested, http_request.headers.get("accept"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _ndjson(messages):
+    async for message in messages:
+        with span("serialization"):
+            line = dumps(message) + b"\n"
+        yield line
 
 @app.post("/api/query")
-async def query_api(request: QueryRequest):
-    return handle_query(request.query, history=request.history)
+async def query_api(request: QueryRequest, http_request: Request):
+    if request.stream:
+        return StreamingResponse(
+            _ndjson(handle_query_stream(request.query, history=request.history, database=request.database,
+                                        session_id=request.session_id)),
+            media_type="application/x-ndjson",
+        )
+    response_format = _response_format(request.format, http_request)
+    response = await handle_query(request.query, history=request.history, page_size=request.page_size,
+                                  database=request.database, session_id=request.session_id)
+    return encode_response(response, response_format)
+
+@app.post("/api/query/page")
+async def page_api(request: PageRequest, http_request: Request):
+    response_format = _response_format(request.format, http_request)
+    return encode_response(await handle_page(request.cursor, page_size=request.page_size), response_format)
+
+@app.delete("/api/session/{session_id}")
+async def close_session_api(session_id: str):
+    if not conversation_sessions.close(session_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return {"closed": session_id}
+
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    task = app.state.warm_up
+    if not task.done():
+        return JSONResponse({"status": "warming_up"}, status_code=503)
+    if task.cancelled() or task.exception() is not None:
+        error = "cancelled" if task.cancelled() else str(task.exception())
+        logger.error("Warm-up failed (%s); retrying", error)
+        _start_warm_up(app)
+        return JSONResponse({"status": "failed", "error": error}, status_code=503)
+    return {"status": "ready"}
+
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
+@app.post("/api/schema/reload")
+async def reload_schema_api(database: str | None = None):
+    # Listing and parsing the schema files is blocking I/O; keep it off the event loop
+    await asyncio.to_thread(reload_shards)
+    try:
+        shard = get_shard(database)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown database {database!r}")
+    snapshot = await asyncio.to_thread(get_schema_cache(shard.name).reload)
+    await asyncio.to_thread(refresh_vectorstore, shard.name)  # retrieval follows the new schema
+    return {"database": shard.name, "version": snapshot.version, "tables": len(snapshot.table_texts)}
 
@@ -0,0 +1,87 @@
+import re
+import threading
+from collections import OrderedDict, defaultdict
+
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+MIN_PREFIX_LEN = 3
+MAX_TERM_WORDS = 3  # "cam1 history" also matches the table cam1_history
+STOPWORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "at", "to", "by", "and", "or", "from", "with",
+    "is", "are", "what", "which", "show", "list", "give", "me", "all", "get", "how", "many",
+}
+MAX_CACHED_INDEXES = 8
+
+
+def question_terms(question: str) -> set[str]:
+    """Lower-cased words of the question plus runs of up to MAX_TERM_WORDS words joined by '_'."""
+    words = _WORD_RE.findall(question.lower())
+    terms = set(words)
+    for n in range(2, MAX_TERM_WORDS + 1):
+        terms.update("_".join(words[i:i + n]) for i in range(len(words) - n + 1))
+    return terms - STOPWORDS
+
+
+class AmbiguityIndex:
+    """Inverted index of the names that make a question ambiguous under the ambiguity checker's rules.
+
+    Only names shared by two or more tables are kept: exact column names, and
+    table-name tokens/prefixes and column-name tokens for partial matches.
+    """
+
+    def __init__(self, schema: dict):
+        self.tables = {}
+        column_tables = defaultdict(set)
+        term_tables = defaultdict(set)
+
+        for table in schema.get("tables", []):
+            name = table["name"]
+            lname = name.lower()
+            self.tables[lname] = name
+            for token in lname.split("_"):
+                term_tables[token].add(name)
+            for i in range(MIN_PREFIX_LEN, len(lname)):
+                term_tables[lname[:i]].add(name)
+            for col in table.get("columns", []):
+                cname = col["name"].lower()
+                column_tables[cname].add(name)
+                for token in cname.split("_"):
+                    if token != cname:
+                        term_tables[token].add(name)
+
+        self.column_tables = {term: tables for term, tables in column_tables.items() if len(tables) > 1}
+        self.term_tables = {term: tables for term, tables in term_tables.items()
+                            if len(tables) > 1 and len(term) > 1 and not term.isdigit()}
+
+    def find_collisions(self, question: str) -> list[dict]:
+        """Return [{term: [tables]}] for terms in the question that could refer to several tables.
+
+        A term is not a collision when the question also names one of its tables explicitly.
+        """
+        terms = question_terms(question)
+        mentioned = {self.tables[term] for term in terms if term in self.tables}
+
+        collisions = []
+        for term in sorted(terms):
+            if term in self.tables:
+                continue
+            matches = self.column_tables.get(term) or self.term_tables.get(term)
+            if matches and not (matches & mentioned):
+                collisions.append({term: sorted(matches)})
+        return collisions
+
+
+_indexes = OrderedDict()  # schema version -> AmbiguityIndex
+_index_lock = threading.Lock()
+
+
+def get_ambiguity_index(snapshot) -> AmbiguityIndex:
+    """Return the index for a schema cache snapshot, building it once per schema version."""
+    with _index_lock:
+        index = _indexes.get(snapshot.version)
+        if index is None:
+            index = AmbiguityIndex(snapshot.schema)
+            _indexes[snapshot.version] = index
+            while len(_indexes) > MAX_CACHED_INDEXES:
+                _indexes.popitem(last=False)
+        _indexes.move_to_end(snapshot.version)
+        return index
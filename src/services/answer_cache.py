@@ -0,0 +1,122 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from config import config as cfg
+
+ANSWER_CACHE_MAX_ENTRIES = getattr(cfg, "ANSWER_CACHE_MAX_ENTRIES", 1000)
+ANSWER_CACHE_TTL_SECONDS = getattr(cfg, "ANSWER_CACHE_TTL_SECONDS", 3600)
+ANSWER_CACHE_SIMILARITY = getattr(cfg, "ANSWER_CACHE_SIMILARITY", 0.97)  # None disables the embedding tier
+
+_SPACE_RE = re.compile(r"\s+")
+# Numbers, quoted strings and capitalised words (names, tickers) other than the first word
+_LITERAL_RE = re.compile(r"""\d+(?:[.,:/-]\d+)*|'[^']*'|"[^"]*"|(?<=\s)[A-Z][\w.-]*""")
+
+
+def normalize_question(question: str) -> str:
+    return _SPACE_RE.sub(" ", question.strip().lower()).rstrip("?.! ")
+
+
+def question_literals(question: str) -> frozenset:
+    """The values a question filters on; embeddings barely tell "sales for 2023" from "sales for 2024"."""
+    return frozenset(_LITERAL_RE.findall(question.strip()))
+
+
+class AnswerCache:
+    """LRU/TTL cache of generated answers (the parsed LLM JSON) keyed by (schema version, question).
+
+    Lookups try the normalized question first, then the most similar cached question
+    by embedding cosine similarity when it reaches similarity_threshold and its literals
+    (question_literals) are exactly the same. Entries from an older schema version are
+    dropped as soon as a newer version is seen.
+    """
+
+    def __init__(self, max_entries: int = ANSWER_CACHE_MAX_ENTRIES, ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+                 similarity_threshold: float | None = ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries = OrderedDict()  # question -> (parsed, unit vector or None, expires_at, literals)
+        self._schema_version = None
+        self._lock = threading.Lock()
+
+    def _sync_version(self, schema_version: str):
+        if schema_version != self._schema_version:
+            self._entries.clear()
+            self._schema_version = schema_version
+
+    def _get_exact(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def lookup(self, question: str, schema_version: str, embed_query=None) -> tuple[dict | None, np.ndarray | None]:
+        """Return (parsed, query_vector); query_vector is passed back to put() to avoid re-embedding.
+
+        The question is embedded as asked, not normalized, so that retrieval for the same question
+        reuses the vector from the embeddings cache instead of making another embedding call.
+        """
+        key = normalize_question(question)
+        with self._lock:
+            self._sync_version(schema_version)
+            parsed = self._get_exact(key)
+            if parsed is not None or embed_query is None or not self.similarity_threshold:
+                return parsed, None
+
+        vector = np.asarray(embed_query(question), dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+
+        with self._lock:
+            if schema_version != self._schema_version:
+                return None, vector
+            now = time.monotonic()
+            literals = question_literals(question)
+            candidates = [(k, entry) for k, entry in self._entries.items()
+                          if entry[1] is not None and entry[2] >= now and entry[3] == literals]
+            if not candidates:
+                return None, vector
+            scores = np.stack([entry[1] for _, entry in candidates]) @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity_threshold:
+                return None, vector
+            best_key, best_entry = candidates[best]
+            self._entries.move_to_end(best_key)
+            return best_entry[0], vector
+
+    def put(self, question: str, schema_version: str, parsed: dict, vector: np.ndarray | None = None):
+        key = normalize_question(question)
+        with self._lock:
+            self._sync_version(schema_version)
+            self._entries[key] = (parsed, vector, time.monotonic() + self.ttl_seconds, question_literals(question))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, question: str):
+        with self._lock:
+            self._entries.pop(normalize_question(question), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_answer_caches = {}
+_answer_caches_lock = threading.Lock()
+
+
+def get_answer_cache(shard: str) -> AnswerCache:
+    """One answer cache per shard, so each follows its own schema version."""
+    with _answer_caches_lock:
+        cache = _answer_caches.get(shard)
+        if cache is None:
+            cache = _answer_caches[shard] = AnswerCache()
+        return cache
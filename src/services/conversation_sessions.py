@@ -0,0 +1,146 @@
+from config import config as cfg
+from src.services.llm_clients import call_llm, get_openai_client
+from src.services.llm_ambiguity_checker import count_tokens
+from src.utils.tracing import record_token_usage, span
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+SESSION_MAX_SESSIONS = getattr(cfg, "SESSION_MAX_SESSIONS", 1000)
+SESSION_TTL_SECONDS = getattr(cfg, "SESSION_TTL_SECONDS", 3600)  # idle time before a conversation is forgotten
+SESSION_HISTORY_TOKEN_BUDGET = getattr(cfg, "SESSION_HISTORY_TOKEN_BUDGET", 1500)  # turns kept verbatim in the prompt
+SESSION_SUMMARY_MAX_WORDS = getattr(cfg, "SESSION_SUMMARY_MAX_WORDS", 150)
+SUMMARY_MODEL = "gpt-4o-mini"
+
+
+def format_turn(turn: dict) -> str:
+    text = f"User: {turn.get('user', '')}\n"
+    if turn.get("sql"):
+        text += f"SQL: {turn['sql']}\n"
+    if turn.get("bot"):
+        text += f"Bot: {turn['bot']}\n"
+    return text
+
+
+def history_window(turns: list[dict], token_budget: int = SESSION_HISTORY_TOKEN_BUDGET) -> int:
+    """Index of the oldest turn that fits in token_budget, counting back from the newest; the newest always fits."""
+    start = len(turns)
+    used = 0
+    while start > 0:
+        tokens = count_tokens(format_turn(turns[start - 1]))
+        if used + tokens > token_budget and start < len(turns):
+            break
+        used += tokens
+        start -= 1
+    return start
+
+
+def build_prompt(turns: list[dict], latest_query: str, summary: str = "") -> str:
+    prompt = f"Summary of the earlier conversation: {summary}\n\n" if summary else ""
+    for turn in turns:
+        prompt += format_turn(turn)
+    prompt += f"User: {latest_query}\nBot:"
+    return prompt
+
+
+def summarize_turns(summary: str, turns: list[dict]) -> str:
+    """Fold turns into the running summary with one LLM call."""
+    conversation = "".join(format_turn(turn) for turn in turns)
+    prompt = f"""
+    Summarize this conversation between a user and a SQL assistant in at most {SESSION_SUMMARY_MAX_WORDS} words.
+    Keep the tables, columns, filters and time ranges the user asked about, and the last SQL query,
+    so that follow-up questions referring back to them can still be answered.
+
+    Earlier summary:
+    {summary or "(none)"}
+
+    Conversation:
+    {conversation}
+    """
+    with span("history_summary"):
+        response = call_llm(
+            SUMMARY_MODEL,
+            get_openai_client().chat.completions.create,
+            model=SUMMARY_MODEL,
+            temperature=0,
+            messages=[{"role": "user", "content": prompt}]
+        )
+    if response.usage is not None:
+        record_token_usage(SUMMARY_MODEL, response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response.choices[0].message.content.strip()
+
+
+class ConversationSession:
+    """Turns of one conversation; turns that fall out of the token window are compacted into a summary."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.summary = ""
+        self._turns = []  # {"user", "sql", "bot"} not yet folded into summary, oldest first
+        self._lock = threading.Lock()
+
+    @property
+    def empty(self) -> bool:
+        return not self._turns and not self.summary
+
+    def add_turn(self, question: str, sql: str | None = None, reply: str | None = None):
+        with self._lock:
+            self._turns.append({"user": question, "sql": sql or "", "bot": reply or ""})
+
+    def prompt_for(self, latest_query: str, token_budget: int = SESSION_HISTORY_TOKEN_BUDGET) -> str:
+        """Return the generation prompt for latest_query with this conversation as context.
+
+        The newest turns (with the SQL generated for them) are kept verbatim within token_budget.
+        When they overflow it, the older turns are folded into the summary until the rest fit in
+        half the budget, so the summary LLM call happens every few turns rather than on each one.
+        """
+        with self._lock:
+            turns = list(self._turns)
+            summary = self.summary
+        start = history_window(turns, token_budget)
+        if start:
+            start = history_window(turns, token_budget // 2)
+            try:
+                summary = summarize_turns(summary, turns[:start])
+            except Exception:
+                # Dropped turns are lost from this prompt only; compaction is retried on the next turn
+                logger.exception("Failed to summarize conversation %s", self.session_id)
+            else:
+                with self._lock:
+                    if self._turns[:start] == turns[:start]:
+                        del self._turns[:start]
+                        self.summary = summary
+        return build_prompt(turns[start:], latest_query, summary)
+
+
+class ConversationSessions:
+    """LRU/TTL store of conversation sessions keyed by an opaque session id."""
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, ttl_seconds: float = SESSION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()  # session id -> (session, expires_at)
+        self._lock = threading.Lock()
+
+    def open(self, session_id: str | None = None) -> ConversationSession:
+        """Return the session for session_id, or a new session when it is missing, unknown or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None) if session_id else None
+            session = entry[0] if entry is not None and entry[1] >= now else ConversationSession(uuid.uuid4().hex)
+            self._sessions[session.session_id] = (session, now + self.ttl_seconds)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def close(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+
+conversation_sessions = ConversationSessions()
@@ -1,34 +1,41 @@
 
-from src.data_access.db_executor import execute_sql
-from src.services.llm_ambiguity_checker import check_ambiguity
-from src.services.retriever_chain import get_qa_chain
-from src.utils.schema_json_util import load_schema
+from src.data_access.db_executor import execute_sql_async, fetch_rows, iter_sql_batches, is_select, STREAM_BATCH_SIZE
+from src.data_access.result_cursor import open_cursor, open_rows_cursor, fetch_page, DEFAULT_PAGE_SIZE
+from src.data_access.query_guard import guard_query
+from src.services.llm_ambiguity_checker import check_ambiguity, build_schema_context
+from src.services.ambiguity_index import get_ambiguity_index
+from src.services.answer_cache import get_answer_cache, normalize_question
+from src.services.conversation_sessions import build_prompt, conversation_sessions, history_window
+from src.services.shard_router import route_question
+from src.services.retriever_chain import get_qa_chain, DEFAULT_MODEL
+from src.services.llm_clients import call_llm
+from src.utils.schema_json_util import get_schema_cache
 from src.utils.md_utils import strip_sql_markdown
-from src.data_access.vectorstore_singleton import get_vectorstore
-
-from dateutil.parser import parse
+from src.data_access.vectorstore_singleton import init_vectorstore
+from src.utils.tracing import span
+from src.utils.single_flight import SingleFlight
+from src.utils.visualizer import build_figure_spec, PLOT_MAX_ROWS
 
+import asyncio
 import json
+import logging
 import traceback
 
+logger = logging.getLogger(__name__)
+
 MOCK_MODE = False
 
-def _is_date_string(value: str) -> bool:
-    try:
-        parse(value)
-        return True
-    except Exception:
-        return False
+# Identical questions asked concurrently (e.g. a dashboard refresh) share one LLM call
+_ambiguity_calls = SingleFlight("ambiguity")
+_generation_calls = SingleFlight("generation")
 
 def build_prompt_with_history(history: list[dict], latest_query: str) -> str:
-    prompt = ""
-    for turn in history:
-        prompt += f"User: {turn.get('user', '')}\Bot: {turn.get('Bot', '')}\n"
-    prompt += f"User: {latest_query}\Bot:"
-    return prompt
+    """Prompt for a client-supplied history ([{'user', 'bot'}, ...]), keeping the newest turns within the token budget."""
+    turns = [{"user": turn.get("user", ""), "bot": turn.get("bot", "")} for turn in history]
+    return build_prompt(turns[history_window(turns):], latest_query)
 
 
-def get_llm_generated_query(message: str) -> dict:
+def get_llm_generated_query(message: str, shard: str | None = None) -> dict:
     if MOCK_MODE:
         return {
             "sql": "SELECT date, cam1 FROM cam1_history WHERE ticker = 'AAPL' LIMIT 10",
@@ -37,15 +44,23 @@ def get_llm_generated_query(message: str) -> dict:
             "y_axis": "cam1",
             "chart_type": "line"
         }
-    vectorstore = get_vectorstore()
-    chain = get_qa_chain(vectorstore)
-    result = chain.invoke({"query": message})
-    print("LLM result:\n", result["result"])
+    vectorstore = init_vectorstore(shard)
+    chain = get_qa_chain(vectorstore, DEFAULT_MODEL)
+    from src.services.llm_callbacks import TracingCallback
+    result = call_llm(DEFAULT_MODEL, chain.invoke, {"query": message}, config={"callbacks": [TracingCallback()]})
+    logger.debug("LLM result: %s", result["result"])
     return json.loads(result["result"])
 
 
-def check_for_ambiguity(message: str, schema_text: str) -> str | None:
-    ambiguity = check_ambiguity(message, schema_text)
+def check_for_ambiguity(message: str, shard: str | None = None) -> str | None:
+    # Only ask the LLM when the question touches a name shared by several tables
+    snapshot = get_schema_cache(shard).get()
+    with span("ambiguity_check"):
+        collisions = get_ambiguity_index(snapshot).find_collisions(message)
+        if not collisions:
+            return None
+        schema_text = build_schema_context(message, snapshot.table_texts, collisions, init_vectorstore(shard))
+        ambiguity = check_ambiguity(message, schema_text)
     if ambiguity.get("ambiguous"):
         clarify_items = ambiguity.get("clarify", [])
         clarification_msg = "🧙 Ambiguity detected in your question:\n"
@@ -60,63 +75,303 @@ def check_for_ambiguity(message: str, schema_text: str) -> str | None:
     return None
 
 
-def handle_query(nl_query: str, history: list[dict]):    
+def _lookup_answer(nl_query: str, shard: str, schema_version: str):
+    embed_query = init_vectorstore(shard).embeddings.embed_query
+    return get_answer_cache(shard).lookup(nl_query, schema_version, embed_query)
+
+
+def _is_error_result(columns: list, rows: list) -> bool:
+    return not columns and bool(rows) and str(rows[0][0]).startswith("⚠️ Error")
+
+
+def _abandon(task: asyncio.Task):
+    """Drop a speculative task; its worker thread runs to completion but the result is discarded."""
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()  # mark any failure as retrieved so asyncio does not log it
+
+
+async def _prepare_query(nl_query: str, history: list[dict], shard: str, session=None):
+    """Run ambiguity detection and SQL generation; returns (early_response, clean_sql, parsed).
+
+    Answers cached for the same (or a near-identical) question skip both LLM calls.
+    Otherwise generation starts speculatively alongside the ambiguity check and is
+    abandoned if the question turns out to be ambiguous.
+    """
+    schema_version = get_schema_cache(shard).get().version
+    if session is not None and not session.empty:
+        prompt = await asyncio.to_thread(session.prompt_for, nl_query)
+    elif history:
+        prompt = build_prompt_with_history(history, nl_query)
+    else:
+        prompt = nl_query
+    use_cache = prompt == nl_query and not MOCK_MODE
+    query_vector = None
+    if use_cache:
+        cached, query_vector = await asyncio.to_thread(_lookup_answer, nl_query, shard, schema_version)
+        if cached is not None:
+            return None, strip_sql_markdown(cached.get("sql", "")), cached
+
+    generation = asyncio.create_task(_generation_calls.do(
+        (shard, schema_version, normalize_question(prompt)), get_llm_generated_query, prompt, shard))
+
+    # Step 1: Check for ambiguityi
+    if not MOCK_MODE:
+        try:
+            ambiguity_msg = await _ambiguity_calls.do(
+                (shard, schema_version, normalize_question(nl_query)), check_for_ambiguity, nl_query, shard)
+        except BaseException:
+            _abandon(generation)
+            raise
+        if ambiguity_msg:
+            _abandon(generation)
+            return {
+                "ambiguity": True,
+                "ambiguity_msg": ambiguity_msg,
+            }, "", {}
+
     try:
-        schema, schema_text = load_schema()
+        parsed = await generation
+    except Exception as e:
+        logger.exception("Failed to parse assistant response")
+        return (f"🧙 Failed to parse assistant response: {e}", None), "", {}
+
+    clean_sql = strip_sql_markdown(parsed.get("sql", ""))
+    logger.debug("Generated SQL: %s", clean_sql)
+    if use_cache and clean_sql:
+        get_answer_cache(shard).put(nl_query, schema_version, parsed, query_vector)
+    return None, clean_sql, parsed
 
-        # Step 1: Check for ambiguityi
-        if not MOCK_MODE:
-            ambiguity_msg = check_for_ambiguity(nl_query, schema_text)
-            if ambiguity_msg:
-                return {
-                    "ambiguity": True,
-                    "ambiguity_msg": ambiguity_msg,
-                }    
 
+async def _execute_first_page(clean_sql: str, page_size: int, shard: str):
+    if not is_select(clean_sql):
+        columns, rows, types = await execute_sql_async(clean_sql, shard=shard)
+        return columns, rows, types, None
+    try:
+        return await asyncio.to_thread(open_cursor, clean_sql, page_size, shard)
+    except Exception as e:
+        return [], [[f"⚠️ Error: {str(e)}"]], [], None
+
+
+def _build_figure(columns: list, rows: list, parsed: dict) -> dict | None:
+    x_axis, y_axis = parsed.get("x_axis"), parsed.get("y_axis")
+    if x_axis not in columns or y_axis not in columns:
+        return None
+    with span("plot"):
         try:
-            if history:
-                print("I am here")
-                prompt = build_prompt_with_history(history, nl_query)
-            else:
-                print("I amthere")
-                prompt = nl_query
-            parsed = get_llm_generated_query(prompt)
-        except Exception as e:
-            traceback.print_exc()
-            return f"🧙 Failed to parse assistant response: {e}", None
-    
-        clean_sql = strip_sql_markdown(parsed.get("sql", ""))
-        print("clean sql:", clean_sql)  
-        columns, rows = execute_sql(clean_sql)
-
-        # return {"result": {"rows": rows, "columns": columns}}
-        column_types = []
-        for col_index in range(len(columns)):
-            sample_value = next((row[col_index] for row in rows if row[col_index] is not None), None)
-            if isinstance(sample_value, (int, float)):
-                column_types.append("number")
-            elif isinstance(sample_value, str) and _is_date_string(sample_value):
-                column_types.append("date")
-            else:
-                column_types.append("string")
+            return build_figure_spec(columns, rows, x_axis, y_axis, parsed.get("chart_type", "bar"))
+        except (TypeError, ValueError) as e:  # e.g. a non-numeric y axis
+            logger.warning("Could not plot %s against %s: %s", y_axis, x_axis, e)
+            return None
+
+
+async def _execute_plot(clean_sql: str, page_size: int, shard: str, parsed: dict):
+    """Read up to PLOT_MAX_ROWS rows to build a downsampled figure; the table pages over the same result."""
+    try:
+        columns, rows, types, complete = await asyncio.to_thread(fetch_rows, clean_sql, PLOT_MAX_ROWS, shard)
+    except Exception as e:
+        return [], [[f"⚠️ Error: {str(e)}"]], [], None, None
+    figure = await asyncio.to_thread(_build_figure, columns, rows, parsed)
+    if figure is not None and not complete:
+        logger.info("Plotted the first %d rows of a larger result", PLOT_MAX_ROWS)
+        figure["layout"]["meta"]["truncated"] = True
+    try:
+        columns, first_page, types, page_token = await asyncio.to_thread(
+            open_rows_cursor, clean_sql, columns, rows, types, page_size, shard)
+    except Exception:
+        logger.exception("Could not open a cursor over the plotted result")
+        first_page, page_token = rows[:page_size], None
+    return columns, first_page, types, page_token, figure
+
+
+def _rejected_response(clean_sql: str, shard: str, decision) -> dict:
+    return {
+        "sql": clean_sql,
+        "database": shard,
+        "ambiguity": False,
+        "guard": decision.to_dict(),
+        "result": {
+            "columns": [],
+            "rows": [[f"⚠️ Query rejected: {decision.reason}"]],
+            "types": [],
+            "plot": False,
+            "cursor": None,
+            "has_more": False
+        }
+    }
+
+
+def _error_response(e: Exception) -> dict:
+    logger.exception("Query failed")
+    return {
+        "sql": "",
+        "result": [],
+        "ambiguity": None,
+        "error": str(e),
+        "traceback": traceback.format_exc()
+    }
+
+
+def _turn_reply(response: dict) -> str | None:
+    """What the conversation history records as the bot's answer, besides the SQL."""
+    if response.get("ambiguity_msg"):
+        return response["ambiguity_msg"]
+    if response.get("error"):
+        return f"Error: {response['error']}"
+    result = response.get("result")
+    if isinstance(result, dict) and not result.get("columns") and result.get("rows"):
+        return str(result["rows"][0][0])  # a rejection or database error message
+    return None
+
+
+def _remember_turn(session, nl_query: str, response) -> dict:
+    if not isinstance(response, dict):
+        return response
+    session.add_turn(nl_query, response.get("sql"), _turn_reply(response))
+    response["session_id"] = session.session_id
+    return response
+
+
+async def handle_query(nl_query: str, history: list[dict], page_size: int = DEFAULT_PAGE_SIZE,
+                       database: str | None = None, session_id: str | None = None):
+    """Answer nl_query against the given database, or the one its vocabulary routes to.
+
+    Unless the client sends its own history, the conversation is kept server-side: the
+    response carries a session_id to send with the next question.
+    """
+    if history:
+        return await _answer_query(nl_query, history, page_size, database)
+    session = conversation_sessions.open(session_id)
+    return _remember_turn(session, nl_query, await _answer_query(nl_query, [], page_size, database, session))
+
+
+async def _answer_query(nl_query: str, history: list[dict], page_size: int, database: str | None, session=None):
+    try:
+        shard = route_question(nl_query, database)
+        early_response, clean_sql, parsed = await _prepare_query(nl_query, history, shard, session)
+        if early_response is not None:
+            return early_response
+
+        decision = await asyncio.to_thread(guard_query, clean_sql, shard, bool(parsed.get("plot")))
+        if decision.rejected:
+            get_answer_cache(shard).discard(nl_query)
+            return _rejected_response(clean_sql, shard, decision)
+
+        figure = None
+        if parsed.get("plot") and is_select(decision.sql):
+            columns, rows, column_types, page_token, figure = await _execute_plot(decision.sql, page_size, shard, parsed)
+        else:
+            columns, rows, column_types, page_token = await _execute_first_page(decision.sql, page_size, shard)
+        if _is_error_result(columns, rows):
+            get_answer_cache(shard).discard(nl_query)
 
         return {
-            "sql": clean_sql,
+            "sql": decision.sql,
+            "database": shard,
             "ambiguity": False,
+            "guard": decision.to_dict(),
             "result": {
                 "columns": columns,
                 "rows": rows,
                 "types": column_types,
-                "plot": parsed.get("plot", False)
+                "plot": parsed.get("plot", False),
+                "figure": figure,
+                "cursor": page_token,
+                "has_more": page_token is not None
             }
-        }        
+        }
 
     except Exception as e:
-        traceback.print_exc()
-        return {
-            "sql": "",
-            "result": [],
-            "ambiguity": None,
-            "error": str(e),
-            "traceback": traceback.format_exc()
+        return _error_response(e)
+
+
+async def handle_page(page_token: str, page_size: int = DEFAULT_PAGE_SIZE):
+    """Return the next page of a result opened by handle_query."""
+    try:
+        columns, rows, column_types, next_token = await asyncio.to_thread(fetch_page, page_token, page_size)
+    except KeyError:
+        return {"result": [], "error": "Unknown or expired cursor; please run the query again."}
+    except Exception as e:
+        return _error_response(e)
+
+    return {
+        "result": {
+            "columns": columns,
+            "rows": rows,
+            "types": column_types,
+            "cursor": next_token,
+            "has_more": next_token is not None
         }
+    }
+
+
+async def handle_query_stream(nl_query: str, history: list[dict], batch_size: int = STREAM_BATCH_SIZE,
+                             database: str | None = None, session_id: str | None = None):
+    """Yield the response as a header message followed by row batches, read from a server-side cursor.
+
+    Each yielded dict is one NDJSON line: {"sql", "columns", "types", "session_id", ...}, then
+    {"rows": [...]} per batch and finally {"done": True, "row_count": n}. Sessions work as in handle_query.
+    """
+    if history:
+        async for message in _stream_query(nl_query, history, batch_size, database):
+            yield message
+        return
+    session = conversation_sessions.open(session_id)
+    header_sent = False
+    async for message in _stream_query(nl_query, [], batch_size, database, session):
+        if not header_sent:
+            header_sent = True
+            message = _remember_turn(session, nl_query, message)
+        yield message
+
+
+async def _stream_query(nl_query: str, history: list[dict], batch_size: int, database: str | None, session=None):
+    shard = None
+    try:
+        shard = route_question(nl_query, database)
+        early_response, clean_sql, parsed = await _prepare_query(nl_query, history, shard, session)
+        if early_response is not None:
+            yield early_response
+            return
+
+        decision = await asyncio.to_thread(guard_query, clean_sql, shard)
+        if decision.rejected:
+            get_answer_cache(shard).discard(nl_query)
+            yield _rejected_response(clean_sql, shard, decision)
+            return
+        clean_sql = decision.sql
+
+        if not is_select(clean_sql):
+            columns, rows, column_types = await execute_sql_async(clean_sql, shard=shard)
+            if _is_error_result(columns, rows):
+                get_answer_cache(shard).discard(nl_query)
+            yield {"sql": clean_sql, "database": shard, "ambiguity": False, "guard": decision.to_dict(),
+                   "columns": columns, "types": column_types, "plot": parsed.get("plot", False)}
+            yield {"rows": rows}
+            yield {"done": True, "row_count": len(rows)}
+            return
+
+        batches = iter_sql_batches(clean_sql, batch_size, shard)
+        row_count = 0
+        header_sent = False
+        try:
+            while True:
+                batch = await asyncio.to_thread(next, batches, None)
+                if batch is None:
+                    break
+                columns, rows, column_types = batch
+                if not header_sent:
+                    header_sent = True
+                    yield {"sql": clean_sql, "database": shard, "ambiguity": False, "guard": decision.to_dict(),
+                           "columns": columns, "types": column_types, "plot": parsed.get("plot", False)}
+                row_count += len(rows)
+                yield {"rows": rows}
+        finally:
+            await asyncio.to_thread(batches.close)
+        yield {"done": True, "row_count": row_count}
+
+    except Exception as e:
+        if shard is not None:
+            get_answer_cache(shard).discard(nl_query)
+        yield _error_response(e)
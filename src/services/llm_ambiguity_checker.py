@@ -1,10 +1,67 @@
 # rag/llm_ambiguity_checker.py
 
-from openai import OpenAI
+from src.services.llm_clients import call_llm, get_openai_client
+from src.utils.tracing import record_token_usage
+from config import config as cfg
+
+from functools import lru_cache
+import logging
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+AMBIGUITY_TOP_K = getattr(cfg, "AMBIGUITY_TOP_K", 8)
+AMBIGUITY_TOKEN_BUDGET = getattr(cfg, "AMBIGUITY_TOKEN_BUDGET", 3000)
+AMBIGUITY_MODEL = "gpt-4o-mini"
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = AMBIGUITY_MODEL) -> int:
+    return len(_encoding(model).encode(text))
+
+
+def build_schema_context(user_query: str, table_texts: dict, collisions: list[dict], vectorstore=None,
+                         top_k: int = AMBIGUITY_TOP_K, token_budget: int = AMBIGUITY_TOKEN_BUDGET) -> str:
+    """Select the flatten_table texts relevant to the question, within token_budget.
+
+    The tables named in the local collisions come first, since the LLM cannot judge the
+    ambiguity without them; the top_k tables retrieved from the vectorstore fill the rest of
+    the budget, so prompt size no longer grows with the schema.
+    """
+    candidates = []
+    for item in collisions:
+        for tables in item.values():
+            candidates.extend(tables)
+    if vectorstore is not None:
+        for doc in vectorstore.similarity_search(user_query, k=top_k):
+            doc_id = doc.metadata.get("id", "")
+            if doc_id.startswith("table_"):
+                candidates.append(doc_id[len("table_"):])
+
+    parts = []
+    used = 0
+    for table_name in dict.fromkeys(candidates):
+        text = table_texts.get(table_name)
+        if text is None:
+            continue
+        tokens = count_tokens(text)
+        if used + tokens > token_budget:
+            continue
+        parts.append(text)
+        used += tokens
+    return "\n\n".join(parts)
 
 
 def check_ambiguity(user_query: str, schema_text: str) -> dict:
-    client = OpenAI()
+    client = get_openai_client()
     
     prompt = f"""
     You are an SQL assistant helping users query a database.
@@ -45,15 +102,20 @@ def check_ambiguity(user_query: str, schema_text: str) -> dict:
     """
 
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    response = call_llm(
+        AMBIGUITY_MODEL,
+        client.chat.completions.create,
+        model=AMBIGUITY_MODEL,
         temperature=0,
         messages=[{"role": "user", "content": prompt}]
     )
 
+    if response.usage is not None:
+        record_token_usage(AMBIGUITY_MODEL, response.usage.prompt_tokens, response.usage.completion_tokens)
+
     import json
     content = response.choices[0].message.content.strip()
-    print("LLM Ambiguity Output:", content)
+    logger.debug("LLM ambiguity output: %s", content)
 
     try:
         return json.loads(content)
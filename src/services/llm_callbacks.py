@@ -0,0 +1,45 @@
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from src.utils.tracing import observe, record_token_usage
+
+
+class TracingCallback(BaseCallbackHandler):
+    """Records the retrieval and generation stages of a chain run, and the token usage of its LLM calls."""
+
+    def __init__(self):
+        self._started = {}  # run_id -> perf_counter at start
+
+    def _start(self, run_id):
+        self._started[run_id] = time.perf_counter()
+
+    def _end(self, stage: str, run_id):
+        start = self._started.pop(run_id, None)
+        if start is not None:
+            observe(stage, time.perf_counter() - start)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end("retrieval", run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end("retrieval", run_id)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end("generation", run_id)
+        llm_output = response.llm_output or {}
+        usage = llm_output.get("token_usage") or {}
+        record_token_usage(llm_output.get("model_name", "unknown"),
+                           usage.get("prompt_tokens"), usage.get("completion_tokens"))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end("generation", run_id)
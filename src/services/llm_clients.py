@@ -0,0 +1,92 @@
+from config import config as cfg
+
+from functools import lru_cache
+import logging
+import random
+import threading
+import time
+
+from src.utils.tracing import LLM_RETRIES
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENT_CALLS = getattr(cfg, "LLM_MAX_CONCURRENT_CALLS", 8)  # per model
+LLM_MODEL_CONCURRENCY = getattr(cfg, "LLM_MODEL_CONCURRENCY", {})  # model name -> limit, overriding the default
+LLM_RETRY_ATTEMPTS = getattr(cfg, "LLM_RETRY_ATTEMPTS", 5)
+LLM_RETRY_BASE_SECONDS = getattr(cfg, "LLM_RETRY_BASE_SECONDS", 0.5)
+LLM_RETRY_MAX_SECONDS = getattr(cfg, "LLM_RETRY_MAX_SECONDS", 20)
+
+_model_slots = {}
+_model_slots_lock = threading.Lock()
+
+
+# openai and langchain_openai are imported on first use, so importing this module stays cheap at startup
+
+@lru_cache(maxsize=None)
+def get_openai_client():
+    """Process-wide OpenAI client; reusing it keeps its HTTP connection pool (and TLS sessions) alive.
+
+    Its own retries are disabled so that call_llm is the only retry policy.
+    """
+    from openai import OpenAI
+
+    return OpenAI(max_retries=0)
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(model_name: str, temperature: float = 0):
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model_name=model_name, temperature=temperature, max_retries=0)
+
+
+def _slots(model: str) -> threading.BoundedSemaphore:
+    with _model_slots_lock:
+        slots = _model_slots.get(model)
+        if slots is None:
+            slots = threading.BoundedSemaphore(LLM_MODEL_CONCURRENCY.get(model, LLM_MAX_CONCURRENT_CALLS))
+            _model_slots[model] = slots
+        return slots
+
+
+def _retryable(error: Exception) -> bool:
+    """Errors the OpenAI SDK itself would retry: rate limits, connection errors and timeouts, 408, 409 and 5xx."""
+    import openai
+
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError,
+                          openai.ConflictError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code == 408
+
+
+def _retry_delay(error, attempt: int) -> float:
+    response = getattr(error, "response", None)  # connection errors have none
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        floor = float(retry_after) if retry_after else 0.0
+    except ValueError:
+        floor = 0.0
+    # Full jitter, so clients that were throttled together do not retry together
+    backoff = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** attempt))
+    return max(floor, backoff)
+
+
+def call_llm(model: str, fn, /, *args, **kwargs):
+    """Call fn (a request to model) holding one of the model's concurrency slots.
+
+    Transient errors (see _retryable) are retried up to LLM_RETRY_ATTEMPTS times with jittered
+    exponential backoff (at least the server's Retry-After); the slot is released while waiting.
+    """
+    slots = _slots(model)
+    for attempt in range(LLM_RETRY_ATTEMPTS + 1):
+        with slots:
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt == LLM_RETRY_ATTEMPTS or not _retryable(e):
+                    raise
+                delay = _retry_delay(e, attempt)
+                error = type(e).__name__
+        LLM_RETRIES.labels(model).inc()
+        logger.warning("%s from %s; retry %d in %.1fs", error, model, attempt + 1, delay)
+        time.sleep(delay)
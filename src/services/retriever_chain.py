@@ -1,10 +1,11 @@
-from langchain.chains import RetrievalQA
-from langchain.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
+from src.data_access.vectorstore_singleton import add_eviction_listener
+from src.services.llm_clients import get_chat_model
 
+from collections import OrderedDict
+from functools import lru_cache
+import threading
 
-def get_qa_chain(vectorstore, model_name="gpt-4o-mini"):
-    prompt_template = """
+PROMPT_TEMPLATE = """
     You are a SQL assistant that generates SQL and identifiers if the user wants to visaulize the results based on the user's query and the schema below. 
     Use the exact table name if specified in the user's question, and the exact column name if specified in the user's query unless ambiguity exists, without substituting or 
     assuming a different table, even if similar table names exist in the schema.
@@ -35,18 +36,59 @@ def get_qa_chain(vectorstore, model_name="gpt-4o-mini"):
     RESPONSE:
     """
 
-    prompt = PromptTemplate.from_template(prompt_template)
+DEFAULT_MODEL = "gpt-4o-mini"
+MAX_CACHED_CHAINS = 16
+
+_chains = OrderedDict()
+_chains_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_prompt():
+    from langchain.prompts import PromptTemplate
+
+    return PromptTemplate.from_template(PROMPT_TEMPLATE)
+
+
+def build_qa_chain(vectorstore, model_name=DEFAULT_MODEL):
+    # langchain is imported when the first chain is built (at warm-up), not when the app starts
+    from langchain.chains import RetrievalQA
 
     retriever = vectorstore.as_retriever()
-    llm = ChatOpenAI(model_name=model_name, temperature=0)
+    llm = get_chat_model(model_name)
 
     chain = RetrievalQA.from_chain_type(
         llm=llm,
         retriever=retriever,
-        chain_type_kwargs={"prompt": prompt},
+        chain_type_kwargs={"prompt": get_prompt()},
         return_source_documents=True
     )
 
     return chain
 
 
+def get_qa_chain(vectorstore, model_name=DEFAULT_MODEL):
+    """Return the chain for (vectorstore, model_name), building it on first use.
+
+    The chain holds no per-call state, so one instance is shared by concurrent requests.
+    """
+    key = (id(vectorstore), model_name)
+    with _chains_lock:
+        entry = _chains.get(key)
+        if entry is None or entry[0] is not vectorstore:
+            entry = (vectorstore, build_qa_chain(vectorstore, model_name))
+            _chains[key] = entry
+            while len(_chains) > MAX_CACHED_CHAINS:
+                _chains.popitem(last=False)
+        _chains.move_to_end(key)
+    return entry[1]
+
+
+def drop_chains(shard: str, vectorstore):
+    """Forget the chains built on an evicted shard's vectorstore; they would otherwise keep it alive."""
+    with _chains_lock:
+        for key in [key for key, entry in _chains.items() if entry[0] is vectorstore]:
+            del _chains[key]
+
+
+add_eviction_listener(drop_chains)
@@ -0,0 +1,60 @@
+from src.data_access.shards import get_shard, get_shards, default_shard_name
+from src.services.ambiguity_index import question_terms
+from src.utils.schema_json_util import load_schema_json
+
+import os
+import threading
+
+_vocabularies = {}  # shard name -> (schema path, mtime_ns, {term: weight})
+_lock = threading.Lock()
+
+
+def _vocabulary(shard: str) -> dict:
+    """Table and column name weights of a shard, read from its schema JSON.
+
+    Only the weights are kept, not the parsed schema, so routing does not keep every
+    shard's schema resident; the file is re-read when its mtime changes.
+    """
+    path = get_shard(shard).schema_path
+    if path is None or not os.path.exists(path):
+        return {}
+    mtime_ns = os.stat(path).st_mtime_ns
+    with _lock:
+        cached = _vocabularies.get(shard)
+        if cached is not None and cached[:2] == (path, mtime_ns):
+            return cached[2]
+
+    weights = {}
+    for table in load_schema_json(path).get("tables", []):
+        name = table["name"].lower()
+        for token in name.split("_"):
+            weights.setdefault(token, 1)
+        for col in table.get("columns", []):
+            weights.setdefault(col["name"].lower(), 1)
+        weights[name] = 3  # a full table name is the strongest signal
+    with _lock:
+        _vocabularies[shard] = (path, mtime_ns, weights)
+    return weights
+
+
+def route_question(question: str, database: str | None = None) -> str:
+    """Pick the shard a question should run against.
+
+    An explicit database name wins; otherwise the shard whose table and column
+    names overlap most with the question, falling back to the default shard.
+    Routing keeps a term-weight vocabulary per shard; it never loads a schema snapshot or vector index.
+    """
+    if database:
+        return get_shard(database).name
+    shards = get_shards()
+    if len(shards) == 1:
+        return next(iter(shards))
+
+    terms = question_terms(question)
+    best, best_score = default_shard_name(), 0
+    for name in shards:
+        vocabulary = _vocabulary(name)
+        score = sum(vocabulary.get(term, 0) for term in terms)
+        if score > best_score:
+            best, best_score = name, score
+    return best
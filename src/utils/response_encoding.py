@@ -0,0 +1,105 @@
+import datetime
+from decimal import Decimal
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+
+from src.utils.tracing import span
+
+ROWS_FORMAT = "rows"
+COLUMNAR_FORMAT = "columnar"
+ARROW_FORMAT = "arrow"
+RESPONSE_FORMATS = (ROWS_FORMAT, COLUMNAR_FORMAT, ARROW_FORMAT)
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+COLUMNAR_MEDIA_TYPE = "application/vnd.talk2tables.columnar+json"
+
+
+def _default(value):
+    # orjson handles datetime, date, time and UUID natively; these are the other values psycopg2 returns
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime.timedelta):
+        return value.total_seconds()
+    if isinstance(value, (bytes, memoryview)):
+        return bytes(value).hex()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+def dumps(content) -> bytes:
+    return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def negotiate_format(requested: str | None, accept: str | None) -> str:
+    """Pick the response format from the request body field, falling back to the Accept header."""
+    if requested:
+        if requested not in RESPONSE_FORMATS:
+            raise ValueError(f"Unknown format {requested!r}; expected one of {', '.join(RESPONSE_FORMATS)}")
+        return requested
+    accept = accept or ""
+    if ARROW_MEDIA_TYPE in accept:
+        return ARROW_FORMAT
+    if COLUMNAR_MEDIA_TYPE in accept:
+        return COLUMNAR_FORMAT
+    return ROWS_FORMAT
+
+
+def _has_result(response) -> bool:
+    # Errors and rejections come back as a single message row with no columns; they stay plain JSON
+    return isinstance(response, dict) and isinstance(response.get("result"), dict) \
+        and "rows" in response["result"] and bool(response["result"].get("columns"))
+
+
+def _columnar(response: dict) -> dict:
+    result = response["result"]
+    columns = result["columns"]
+    data = [list(values) for values in zip(*result["rows"])] if result["rows"] else [[] for _ in columns]
+    body = dict(response)
+    body["result"] = {key: value for key, value in result.items() if key != "rows"}
+    body["result"]["data"] = data
+    return body
+
+
+def _arrow_column(pa, values: list):
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if value is None else str(value) for value in values], type=pa.string())
+
+
+def _arrow(response: dict) -> bytes:
+    import pyarrow as pa
+
+    result = response["result"]
+    columns = result["columns"]
+    values = list(zip(*result["rows"])) if result["rows"] else [() for _ in columns]
+    arrays = [_arrow_column(pa, list(column_values)) for column_values in values]
+
+    metadata = {key: value for key, value in response.items() if key != "result"}
+    metadata["result"] = {key: value for key, value in result.items() if key not in ("rows", "columns")}
+    batch = pa.RecordBatch.from_arrays(arrays, names=columns)
+    schema = batch.schema.with_metadata({"talk2tables": dumps(metadata)})
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(batch.replace_schema_metadata(schema.metadata))
+    return sink.getvalue().to_pybytes()
+
+
+def encode_response(response, response_format: str = ROWS_FORMAT) -> Response:
+    """Encode a handle_query/handle_page response in the negotiated format.
+
+    "rows" keeps the {"columns", "rows", "types"} JSON shape. "columnar" replaces
+    rows with one value list per column ("data") and is serialized with orjson.
+    "arrow" returns an Arrow IPC stream with the non-row fields as schema metadata.
+    Responses without a result (ambiguity, errors) are always plain JSON.
+    """
+    with span("serialization"):
+        if response_format == ROWS_FORMAT or not _has_result(response):
+            return JSONResponse(jsonable_encoder(response))
+        if response_format == COLUMNAR_FORMAT:
+            return Response(dumps(_columnar(response)), media_type=COLUMNAR_MEDIA_TYPE)
+        return Response(_arrow(response), media_type=ARROW_MEDIA_TYPE)
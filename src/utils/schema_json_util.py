@@ -1,15 +1,33 @@
 from config.config import SCHEMA_JSON_DIR
+from src.data_access.shards import get_shard
+from src.utils.tracing import span
+import hashlib
 import json
+import logging
 import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCHEMA_NAME = "public"
+
+
+def qualified_name(schema_name: str | None, table_name: str) -> str:
+    """Table name as generated SQL must write it: tables outside the default schema are schema-qualified."""
+    if not schema_name or schema_name == DEFAULT_SCHEMA_NAME:
+        return table_name
+    return f"{schema_name}.{table_name}"
+
 
 def load_schema_json(path: str):
-    print(path)
+    logger.info("Loading schema %s", path)
     with open(path, "r") as f:
         return json.load(f)
 
 
-def flatten_table(table: dict) -> str:
-    lines = [f"Table: {table['name']}"]
+def flatten_table(table: dict, schema_name: str | None = None) -> str:
+    # The LLM writes the name it is shown, so tables outside public are shown schema-qualified
+    lines = [f"Table: {qualified_name(schema_name, table['name'])}"]
     for col in table.get("columns", []):
         line = f"- {col['name']} ({col['type']})"
         if col.get("is_primary"):
@@ -20,28 +38,81 @@ def flatten_table(table: dict) -> str:
     return "\n".join(lines)
     
 
-def flatten_schema(schema: dict) -> str:
-    text = f"Schema: {schema.get('schema', '')}\n\n"
-    for table in schema.get("tables", []):
-        text += f"Table: {table['name']}\n"
-        for col in table['columns']:
-            line = f"  - {col['name']} ({col['type']})"
-            if col.get("is_primary"):
-                line += " [PK]"
-            if col.get("is_foreign"):
-                line += f" [FK -> {col.get('references')}]"
-            text += line + "\n"
-        text += "\n"
-    return text
-
-
-def load_schema() -> tuple:
-    for file in os.listdir(SCHEMA_JSON_DIR):
-        if file.endswith(".json"):
-            json_path = file
-            schema = load_schema_json(f"""{SCHEMA_JSON_DIR}/{json_path}""")
-            schema_text = flatten_schema(schema) # TODO: Use flatten_table for each table with metadata is better option
-            break
-            ## TODO : handle multiple json files
-    return schema, schema_text
+class SchemaSnapshot:
+    """Parsed schema plus its flattened texts, computed once per schema file version.
+
+    When the schema carries per-table signatures (see schema_extractor), flatten_table
+    texts of tables whose signature is unchanged are reused from the previous snapshot.
+    """
+
+    def __init__(self, path: str, raw: bytes, mtime_ns: int, previous: "SchemaSnapshot | None" = None):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.version = hashlib.sha256(raw).hexdigest()[:16]
+        self.schema = json.loads(raw)
+
+        signatures = self.schema.get("signatures", {})
+        previous_signatures = previous.schema.get("signatures", {}) if previous else {}
+        self.table_texts = {}
+        for table in self.schema.get("tables", []):
+            name = table["name"]
+            if name in signatures and previous_signatures.get(name) == signatures[name] \
+                    and name in previous.table_texts:
+                self.table_texts[name] = previous.table_texts[name]
+            else:
+                self.table_texts[name] = flatten_table(table, self.schema.get("schema"))
+
+
+class SchemaCache:
+    """Schema cache for one schema file; the file is only re-read when its mtime changes and only
+    re-parsed when its content hash changes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def get(self, force_reload: bool = False) -> SchemaSnapshot:
+        with self._lock:
+            path = self.path
+            if path is None:
+                raise FileNotFoundError(f"No schema JSON found in {SCHEMA_JSON_DIR}")
+            mtime_ns = os.stat(path).st_mtime_ns
+            snapshot = self._snapshot
+            if not force_reload and snapshot and snapshot.mtime_ns == mtime_ns:
+                return snapshot
+
+            with span("schema_load"):
+                with open(path, "rb") as f:
+                    raw = f.read()
+                if not force_reload and snapshot and snapshot.version == hashlib.sha256(raw).hexdigest()[:16]:
+                    snapshot.mtime_ns = mtime_ns  # touched but unchanged
+                    return snapshot
+
+                logger.info("Loading schema %s", path)
+                self._snapshot = SchemaSnapshot(path, raw, mtime_ns, snapshot)
+            return self._snapshot
+
+    def reload(self) -> SchemaSnapshot:
+        return self.get(force_reload=True)
+
+
+_schema_caches = {}
+_schema_caches_lock = threading.Lock()
+
+
+def get_schema_cache(shard: str | None = None) -> SchemaCache:
+    """Process-wide schema cache of a shard (the default shard when None)."""
+    target = get_shard(shard)
+    with _schema_caches_lock:
+        cache = _schema_caches.get(target.name)
+        if cache is None or cache.path != target.schema_path:
+            cache = SchemaCache(target.schema_path)
+            _schema_caches[target.name] = cache
+        return cache
+
 
+def drop_schema_cache(shard: str):
+    """Forget a shard's parsed schema; it is re-read from its file on next use."""
+    with _schema_caches_lock:
+        _schema_caches.pop(shard, None)
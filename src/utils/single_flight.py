@@ -0,0 +1,31 @@
+import asyncio
+
+from src.utils.tracing import COALESCED_CALLS
+
+
+class SingleFlight:
+    """Coalesces identical concurrent calls: callers with the same key share one pending worker-thread call.
+
+    The shared call is shielded, so a caller that gives up (e.g. an abandoned speculative
+    generation) does not cancel it for the others. Keys are forgotten once the call finishes.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._calls = {}  # key -> asyncio.Task
+
+    def _forget(self, key, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here in case every caller gave up
+
+    async def do(self, key, fn, *args):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(asyncio.to_thread(fn, *args))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            COALESCED_CALLS.labels(self.kind).inc()
+        return await asyncio.shield(task)
@@ -0,0 +1,90 @@
+from config import config as cfg
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import logging.handlers
+import queue
+import time
+
+from prometheus_client import Counter, Histogram
+
+TIMING_HEADERS = getattr(cfg, "TIMING_HEADERS", False)
+LOG_LEVEL = getattr(cfg, "LOG_LEVEL", "INFO")
+
+STAGE_SECONDS = Histogram(
+    "talk2tables_stage_seconds", "Time spent in each pipeline stage", ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUEST_SECONDS = Histogram("talk2tables_request_seconds", "HTTP request latency", ["path", "status"])
+LLM_TOKENS = Counter("talk2tables_llm_tokens_total", "Tokens reported by the OpenAI API", ["model", "kind"])
+LLM_RETRIES = Counter("talk2tables_llm_retries_total", "LLM calls retried after a transient error", ["model"])
+COALESCED_CALLS = Counter("talk2tables_coalesced_calls_total", "Calls that joined an identical in-flight call",
+                          ["kind"])
+
+# Per-request {stage: seconds}; asyncio.to_thread copies the context, so worker threads add to the same dict
+_timings = ContextVar("stage_timings", default=None)
+_log_listener = None
+_log_handler = None
+
+
+def start_timings() -> dict:
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def observe(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block as one pipeline stage. Spans may nest (sql_execution contains type_inference)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start)
+
+
+def record_token_usage(model: str, prompt_tokens: int | None, completion_tokens: int | None):
+    if prompt_tokens:
+        LLM_TOKENS.labels(model, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(model, "completion").inc(completion_tokens)
+
+
+def server_timing_header(timings: dict, total_seconds: float) -> str:
+    """Format timings as a Server-Timing header value (durations in milliseconds)."""
+    parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    parts.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+
+def configure_logging(level: str = LOG_LEVEL):
+    """Send log records through a queue to a background thread, so request threads never block on stderr."""
+    global _log_listener, _log_handler
+    if _log_listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    _log_listener = logging.handlers.QueueListener(log_queue, handler)
+    _log_listener.start()
+
+    _log_handler = logging.handlers.QueueHandler(log_queue)
+    root = logging.getLogger()
+    root.addHandler(_log_handler)
+    root.setLevel(level)
+
+
+def stop_logging():
+    global _log_listener, _log_handler
+    if _log_listener is not None:
+        logging.getLogger().removeHandler(_log_handler)
+        _log_listener.stop()
+        _log_listener = _log_handler = None
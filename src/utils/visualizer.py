@@ -1,25 +1,113 @@
-import plotly.express as px
-import pandas as pd
-import os
-import uuid
-
-def plot_with_plotly(columns, rows, x_axis, y_axis, chart_type="bar"):
-    df = pd.DataFrame(rows, columns=columns)
-
-    if chart_type == "bar":
-        fig = px.bar(df, x=x_axis, y=y_axis)
-    elif chart_type == "line":
-        fig = px.line(df, x=x_axis, y=y_axis)
-    elif chart_type == "pie":
-        fig = px.pie(df, names=x_axis, values=y_axis)
-    else:
-        fig = px.bar(df, x=x_axis, y=y_axis)  # fallback
+from config import config as cfg
+
+import datetime
+from decimal import Decimal
+
+import numpy as np
+
+PLOT_MAX_POINTS = getattr(cfg, "PLOT_MAX_POINTS", 2000)  # line charts above this are downsampled with LTTB
+PLOT_MAX_CATEGORIES = getattr(cfg, "PLOT_MAX_CATEGORIES", 30)  # bar/pie charts keep the top N - 1 plus "Other"
+PLOT_MAX_ROWS = getattr(cfg, "PLOT_MAX_ROWS", 100_000)  # rows read from the database to build one plot
+
+OTHER_LABEL = "Other"
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of threshold points that keep the visual shape of (x, y)."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)  # threshold - 2 buckets between the end points
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    selected = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        areas = np.abs((x[selected] - avg_x) * (y[start:end] - y[selected])
+                       - (x[selected] - x[start:end]) * (avg_y - y[selected]))
+        selected = start + int(np.argmax(areas))
+        indices[i + 1] = selected
+    indices[-1] = n - 1
+    return indices
+
+
+def _to_float(value) -> float:
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    if isinstance(value, datetime.date):
+        return datetime.datetime.combine(value, datetime.time()).timestamp()
+    return float(value)
 
-    os.makedirs("static/plots", exist_ok=True)
-    plot_filename = f"{uuid.uuid4().hex}.html"
-    html_path = os.path.join("static", "plots", plot_filename)
-    fig.write_html(html_path, full_html=True, include_plotlyjs="cdn")
-    return f"http://localhost:7861/plots/{plot_filename}"
 
+def _numeric_axis(values: list) -> np.ndarray:
+    """Numbers and dates as floats; any other axis (labels) by position."""
+    try:
+        return np.fromiter((_to_float(value) for value in values), dtype=np.float64, count=len(values))
+    except (TypeError, ValueError):
+        return np.arange(len(values), dtype=np.float64)
+
+
+def _plain(value):
+    return float(value) if isinstance(value, Decimal) else value
+
+
+def top_n(labels: list, values: list, n: int) -> tuple[list, list, bool]:
+    """Sum values per label and keep the n - 1 largest, folding the rest into OTHER_LABEL.
+
+    Returns (labels, totals, folded).
+    """
+    totals = {}
+    for label, value in zip(labels, values):
+        key = label if isinstance(label, (str, int, float, datetime.date)) else str(label)
+        totals[key] = totals.get(key, 0.0) + float(value)
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)
+    if len(ranked) <= n:
+        return [label for label, _ in ranked], [total for _, total in ranked], False
+    kept = ranked[:n - 1]
+    other = sum(total for _, total in ranked[n - 1:])
+    return [label for label, _ in kept] + [OTHER_LABEL], [total for _, total in kept] + [other], True
+
+
+def build_figure_spec(columns: list, rows: list, x_axis: str, y_axis: str, chart_type: str = "bar",
+                      max_points: int = PLOT_MAX_POINTS, max_categories: int = PLOT_MAX_CATEGORIES) -> dict:
+    """Return a Plotly figure as a plain dict, downsampled server-side so its size no longer grows with rows.
+
+    Line charts above max_points keep an LTTB selection of points; bar and pie charts with more
+    than max_categories rows become the top categories plus "Other". layout.meta records the
+    original and plotted point counts and the method used.
+    """
+    x_index, y_index = columns.index(x_axis), columns.index(y_axis)
+    points = [(row[x_index], row[y_index]) for row in rows if row[y_index] is not None]
+    xs = [_plain(x) for x, _ in points]
+    ys = [float(y) for _, y in points]
+    method = None
+
+    if chart_type == "line":
+        if len(xs) > max_points:
+            indices = lttb_indices(_numeric_axis(xs), np.asarray(ys, dtype=np.float64), max_points)
+            xs = [xs[i] for i in indices]
+            ys = [ys[i] for i in indices]
+            method = "lttb"
+        trace = {"type": "scatter", "mode": "lines", "x": xs, "y": ys, "name": y_axis}
+    elif chart_type == "pie":
+        labels, values, folded = top_n(xs, ys, max_categories)
+        method = "top_n" if folded else None
+        trace = {"type": "pie", "labels": labels, "values": values}
+    else:
+        if len(xs) > max_categories:
+            xs, ys, folded = top_n(xs, ys, max_categories)
+            method = "top_n" if folded else "sum"
+        trace = {"type": "bar", "x": xs, "y": ys, "name": y_axis}
 
-    
\ No newline at end of file
+    layout = {
+        "meta": {"source_points": len(points), "points": len(trace.get("x", trace.get("labels"))),
+                 "downsampling": method},
+    }
+    if chart_type != "pie":
+        layout["xaxis"] = {"title": {"text": x_axis}}
+        layout["yaxis"] = {"title": {"text": y_axis}}
+    return {"data": [trace], "layout": layout}
@@ -0,0 +1,17 @@
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Modules read settings with `from config import config as cfg`; without a local
+# config/config.py the tests run against the documented defaults in config.py.example.
+if importlib.util.find_spec("config.config") is None:
+    import config
+
+    loader = importlib.machinery.SourceFileLoader("config.config", os.path.join(ROOT, "config", "config.py.example"))
+    module = importlib.util.module_from_spec(importlib.util.spec_from_loader("config.config", loader))
+    loader.exec_module(module)
+    sys.modules["config.config"] = config.config = module
@@ -0,0 +1,52 @@
+from src.services.ambiguity_index import AmbiguityIndex, get_ambiguity_index, question_terms
+
+SCHEMA = {
+    "tables": [
+        {"name": "cam1_history", "columns": [{"name": "date"}, {"name": "ticker"}, {"name": "cam1"}]},
+        {"name": "cam2_history", "columns": [{"name": "date"}, {"name": "ticker"}, {"name": "cam2"}]},
+        {"name": "users", "columns": [{"name": "id"}, {"name": "user_name"}]},
+    ]
+}
+
+
+class Snapshot:
+    def __init__(self, version, schema=SCHEMA):
+        self.version = version
+        self.schema = schema
+
+
+def collision_terms(question):
+    return {term for item in AmbiguityIndex(SCHEMA).find_collisions(question) for term in item}
+
+
+def test_question_terms_join_adjacent_words_and_drop_stopwords():
+    terms = question_terms("Show the cam1 history")
+    assert "cam1_history" in terms
+    assert "cam1" in terms and "history" in terms
+    assert "show" not in terms and "the" not in terms
+
+
+def test_shared_column_is_a_collision():
+    assert AmbiguityIndex(SCHEMA).find_collisions("latest ticker") == [
+        {"ticker": ["cam1_history", "cam2_history"]}
+    ]
+
+
+def test_naming_the_table_resolves_the_collision():
+    assert "ticker" not in collision_terms("ticker in cam1_history")
+    assert "ticker" not in collision_terms("ticker in cam1 history")
+
+
+def test_partial_table_name_is_a_collision():
+    assert {"cam", "history"} <= collision_terms("cam history for AAPL")
+
+
+def test_names_of_a_single_table_are_not_collisions():
+    assert collision_terms("user_name of users") == set()
+    assert collision_terms("cam1 values") == set()
+
+
+def test_index_is_built_once_per_schema_version():
+    first = get_ambiguity_index(Snapshot("test-v1"))
+    assert get_ambiguity_index(Snapshot("test-v1")) is first
+    assert get_ambiguity_index(Snapshot("test-v2")) is not first
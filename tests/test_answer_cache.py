@@ -0,0 +1,86 @@
+import numpy as np
+
+from src.services.answer_cache import AnswerCache, normalize_question, question_literals
+
+PARSED = {"sql": "SELECT 1", "plot": False}
+
+
+def embed_all_alike(text):
+    # Every question embeds to the same vector, so only the literal check tells them apart
+    return np.ones(4)
+
+
+def test_normalize_question():
+    assert normalize_question("  Top   Sellers?? ") == "top sellers"
+
+
+def test_question_literals():
+    assert question_literals("Sales for AAPL in 2023-01") == {"AAPL", "2023-01"}
+    assert question_literals("Orders from 'north east' over 1.5") == {"'north east'", "1.5"}
+    assert question_literals("Show total revenue") == frozenset()
+
+
+def test_exact_hit_after_normalization():
+    cache = AnswerCache()
+    cache.put("Top sellers?", "v1", PARSED)
+    assert cache.lookup("top   sellers", "v1") == (PARSED, None)
+
+
+def test_new_schema_version_drops_entries():
+    cache = AnswerCache()
+    cache.put("top sellers", "v1", PARSED)
+    assert cache.lookup("top sellers", "v2")[0] is None
+    assert cache.lookup("top sellers", "v1")[0] is None
+
+
+def test_expired_entry_is_a_miss():
+    cache = AnswerCache(ttl_seconds=-1)
+    cache.put("top sellers", "v1", PARSED)
+    assert cache.lookup("top sellers", "v1")[0] is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnswerCache(max_entries=2)
+    cache.put("a", "v1", {"sql": "a"})
+    cache.put("b", "v1", {"sql": "b"})
+    cache.lookup("a", "v1")
+    cache.put("c", "v1", {"sql": "c"})
+    assert cache.lookup("b", "v1")[0] is None
+    assert cache.lookup("a", "v1")[0] == {"sql": "a"}
+
+
+def test_similar_question_hits_and_returns_its_vector():
+    cache = AnswerCache(similarity_threshold=0.9)
+    _, vector = cache.lookup("revenue by region for 2023", "v1", embed_all_alike)
+    cache.put("revenue by region for 2023", "v1", PARSED, vector)
+
+    parsed, query_vector = cache.lookup("what was revenue per region in 2023", "v1", embed_all_alike)
+    assert parsed == PARSED
+    assert np.isclose(np.linalg.norm(query_vector), 1.0)
+
+
+def test_similarity_tier_embeds_the_question_as_asked():
+    embedded = []
+    AnswerCache().lookup("Revenue by region?", "v1", lambda text: embedded.append(text) or np.ones(4))
+    assert embedded == ["Revenue by region?"]
+
+
+def test_similar_question_with_other_literals_misses():
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.put("revenue for AAPL in 2023", "v1", PARSED, np.full(4, 0.5))
+    assert cache.lookup("revenue for AAPL in 2024", "v1", embed_all_alike)[0] is None
+    assert cache.lookup("revenue for MSFT in 2023", "v1", embed_all_alike)[0] is None
+    assert cache.lookup("revenue for AAPL", "v1", embed_all_alike)[0] is None
+
+
+def test_similarity_below_threshold_misses():
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.put("revenue", "v1", PARSED, np.array([1.0, 0.0, 0.0, 0.0]))
+    assert cache.lookup("profit", "v1", lambda text: np.array([0.0, 1.0, 0.0, 0.0]))[0] is None
+
+
+def test_discard_removes_the_entry():
+    cache = AnswerCache()
+    cache.put("top sellers", "v1", PARSED)
+    cache.discard("Top sellers?")
+    assert cache.lookup("top sellers", "v1")[0] is None
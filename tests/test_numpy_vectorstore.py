@@ -0,0 +1,71 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.documents import Document  # noqa: E402
+
+from src.data_access.embeddings import HashingEmbeddings  # noqa: E402
+from src.data_access.numpy_vectorstore import DOCUMENTS_FILE, VECTORS_FILE, NumpyVectorStore  # noqa: E402
+
+TEXTS = ["orders: id, customer_id, total", "customers: id, name, email", "products: id, title, price"]
+METADATAS = [{"id": "table_orders"}, {"id": "table_customers"}, {"id": "table_products"}]
+IDS = ["orders", "customers", "products"]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return NumpyVectorStore.from_texts(TEXTS, HashingEmbeddings(), METADATAS, directory=str(tmp_path), ids=IDS)
+
+
+def test_search_ranks_the_matching_document_first(store):
+    docs = store.similarity_search("customer email", k=2)
+    assert len(docs) == 2
+    assert docs[0].metadata["id"] == "table_customers"
+
+
+def test_scores_are_cosine_similarities(store):
+    results = store.similarity_search_with_score(TEXTS[2], k=3)
+    assert results[0][0].page_content == TEXTS[2]
+    assert results[0][1] == pytest.approx(1.0, abs=1e-5)
+    assert [score for _, score in results] == sorted((score for _, score in results), reverse=True)
+
+
+def test_filter_restricts_the_candidates(store):
+    docs = store.similarity_search("customer email", k=3, filter={"id": "table_products"})
+    assert [doc.metadata["id"] for doc in docs] == ["table_products"]
+
+
+def test_adding_an_existing_id_replaces_it(store):
+    store.add_documents([Document(page_content="orders: id, shipped_at", metadata={"id": "table_orders"})],
+                        ids=["orders"])
+    listing = store.get()
+    assert sorted(listing["ids"]) == sorted(IDS)
+    assert "orders: id, shipped_at" in listing["documents"]
+
+
+def test_delete(store):
+    store.delete(["customers"])
+    assert "customers" not in store.get()["ids"]
+    assert all(doc.metadata["id"] != "table_customers" for doc in store.similarity_search("customer email", k=3))
+
+
+def test_persisted_index_is_reopened_memory_mapped(store, tmp_path):
+    store.delete(["products"])
+    store.persist()
+    reopened = NumpyVectorStore(HashingEmbeddings(), str(tmp_path))
+    assert isinstance(reopened._index[0], np.memmap)
+    assert sorted(reopened.get()["ids"]) == ["customers", "orders"]
+    assert reopened.similarity_search("customer email", k=1)[0].metadata["id"] == "table_customers"
+
+
+def test_mismatched_files_open_empty(store, tmp_path):
+    with open(os.path.join(tmp_path, DOCUMENTS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"ids": ["orders"], "texts": [TEXTS[0]], "metadatas": [METADATAS[0]]}, f)
+    assert os.path.exists(os.path.join(tmp_path, VECTORS_FILE))
+    reopened = NumpyVectorStore(HashingEmbeddings(), str(tmp_path))
+    assert reopened.get()["ids"] == []
+    assert reopened.similarity_search("orders", k=2) == []
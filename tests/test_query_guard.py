@@ -0,0 +1,119 @@
+import psycopg2
+import pytest
+
+from src.data_access import query_guard
+from src.data_access.query_guard import ALLOWED, LIMITED, REJECTED, guard_query, limit_sql
+
+
+class Shard:
+    name = "test"
+
+
+class Plans(dict):
+    """Maps SQL to its EXPLAIN (cost, rows) estimate; explained lists each statement EXPLAINed."""
+
+    def __init__(self):
+        super().__init__()
+        self.explained = []
+
+    def explain(self, sql, shard=None):
+        self.explained.append(sql)
+        if isinstance(self[sql], Exception):
+            raise self[sql]
+        return self[sql]
+
+
+@pytest.fixture
+def plans(monkeypatch):
+    plans = Plans()
+    monkeypatch.setattr(query_guard, "explain", plans.explain)
+    monkeypatch.setattr(query_guard, "get_shard", lambda shard: Shard())
+    monkeypatch.setattr(query_guard, "GUARD_ENABLED", True)
+    monkeypatch.setattr(query_guard, "READ_ONLY", True)
+    monkeypatch.setattr(query_guard, "GUARD_MAX_COST", 1000)
+    monkeypatch.setattr(query_guard, "GUARD_MAX_ROWS", 100)
+    monkeypatch.setattr(query_guard, "GUARD_AUTO_LIMIT", 10)
+    return plans
+
+
+SQL = "SELECT * FROM orders"
+
+
+def test_cheap_query_is_allowed(plans):
+    plans[SQL] = (50, 20)
+    decision = guard_query(SQL)
+    assert (decision.action, decision.sql, decision.estimated_rows) == (ALLOWED, SQL, 20)
+
+
+def test_too_many_rows_is_limited(plans):
+    plans[SQL] = (500, 5000)
+    plans[limit_sql(SQL, 10)] = (5, 10)
+    decision = guard_query(SQL)
+    assert decision.action == LIMITED
+    assert decision.sql == limit_sql(SQL, 10)
+    assert decision.limit == 10
+    assert decision.estimated_rows == 10
+
+
+def test_still_too_expensive_after_the_limit_is_rejected(plans):
+    plans[SQL + " ORDER BY total"] = (5000, 5000)
+    plans[limit_sql(SQL + " ORDER BY total", 10)] = (4000, 10)
+    decision = guard_query(SQL + " ORDER BY total")
+    assert decision.rejected
+    assert "narrow the question" in decision.reason
+
+
+def test_without_auto_limit_an_expensive_query_is_rejected(plans, monkeypatch):
+    monkeypatch.setattr(query_guard, "GUARD_AUTO_LIMIT", None)
+    plans[SQL] = (500, 5000)
+    assert guard_query(SQL).action == REJECTED
+
+
+def test_plot_is_not_limited_on_its_row_estimate(plans):
+    plans[SQL] = (500, 5000)
+    decision = guard_query(SQL, plot=True)
+    assert (decision.action, decision.sql) == (ALLOWED, SQL)
+
+
+def test_plot_over_the_cost_bound_is_rejected_not_limited(plans):
+    plans[SQL] = (5000, 5000)
+    assert guard_query(SQL, plot=True).action == REJECTED
+    assert plans.explained == [SQL]
+
+
+def test_several_statements_are_rejected_without_explain(plans):
+    decision = guard_query("SELECT 1; DROP TABLE orders")
+    assert decision.rejected
+    assert plans.explained == []
+
+
+@pytest.mark.parametrize("sql", ["SELECT * FROM orders;\n-- all orders", "SELECT * FROM orders; /* done */;"])
+def test_trailing_comment_is_not_a_second_statement(plans, sql):
+    plans["SELECT * FROM orders;"] = (50, 20)
+    decision = guard_query(sql)
+    assert (decision.action, decision.sql) == (ALLOWED, "SELECT * FROM orders;")
+
+
+def test_write_is_rejected_in_read_only_mode(plans):
+    assert guard_query("DELETE FROM orders").rejected
+    assert plans.explained == []
+
+
+def test_invalid_sql_is_left_to_fail_at_execution(plans):
+    plans["SELECT * FROM missing_table"] = psycopg2.errors.UndefinedTable("relation does not exist")
+    decision = guard_query("SELECT * FROM missing_table")
+    assert (decision.action, decision.estimated_cost) == (ALLOWED, None)
+
+
+@pytest.mark.parametrize("error", [
+    psycopg2.errors.QueryCanceled("canceling statement due to statement timeout"),
+    psycopg2.OperationalError("server closed the connection unexpectedly"),
+])
+def test_explain_timeout_or_connection_error_rejects(plans, error):
+    plans[SQL] = error
+    assert guard_query(SQL).rejected
+
+
+def test_disabled_guard_allows_everything(plans, monkeypatch):
+    monkeypatch.setattr(query_guard, "GUARD_ENABLED", False)
+    assert guard_query("SELECT 1; SELECT 2").action == ALLOWED
@@ -0,0 +1,83 @@
+import pytest
+
+from src.data_access.result_cache import ResultCache, extract_tables, normalize_sql
+
+COLUMNS, ROWS, TYPES = ["id"], [[1], [2]], ["int"]
+
+
+def test_normalize_sql_collapses_whitespace_and_comments():
+    assert normalize_sql("select  *\n  from orders -- all of them\n;") == "SELECT * FROM orders"
+
+
+def test_normalize_sql_keeps_literals_and_quoted_identifiers():
+    assert normalize_sql("select * from t where name = 'a  b'") == "SELECT * FROM t WHERE name = 'a  b'"
+    assert normalize_sql("select \"Odd  Name\" from t") == "SELECT \"Odd  Name\" FROM t"
+    assert normalize_sql("select 'a  b'") != normalize_sql("select 'a b'")
+
+
+def test_whitespace_variants_share_an_entry():
+    cache = ResultCache()
+    assert cache.put("select id from orders", COLUMNS, ROWS, TYPES, "sales")
+    assert cache.get("SELECT id\n  FROM orders;", "sales") == (COLUMNS, ROWS, TYPES)
+    assert cache.get("select id from orders", "other") is None
+
+
+@pytest.mark.parametrize("sql", [
+    "select now()",
+    "select * from orders where created_at > current_date - 7",
+    "select statement_timestamp()",
+    "select transaction_timestamp()",
+    "select * from orders where day = 'today'",
+    "select * from orders where created_at < ' now '::timestamp",
+    "select random()",
+])
+def test_volatile_sql_is_not_cached(sql):
+    cache = ResultCache()
+    assert not cache.put(sql, COLUMNS, ROWS, TYPES)
+    assert cache.get(sql) is None
+
+
+def test_expired_entry_is_a_miss():
+    cache = ResultCache(ttl_seconds=-1)
+    cache.put("select id from orders", COLUMNS, ROWS, TYPES)
+    assert cache.get("select id from orders") is None
+
+
+def test_oversized_entry_is_not_cached():
+    assert not ResultCache(max_entry_bytes=1).put("select id from orders", COLUMNS, ROWS, TYPES)
+
+
+def test_memory_cap_evicts_the_oldest_entry():
+    cache = ResultCache()
+    cache.put("select id from a", COLUMNS, ROWS, TYPES)
+    cache.max_bytes = cache._bytes + 1
+    cache.put("select id from b", COLUMNS, ROWS, TYPES)
+    assert cache.get("select id from a") is None
+    assert cache.get("select id from b") is not None
+
+
+def test_write_invalidates_readers_of_the_table_on_its_shard():
+    cache = ResultCache()
+    cache.put("select id from orders join users on users.id = orders.user_id", COLUMNS, ROWS, TYPES, "sales")
+    cache.put("select id from orders", COLUMNS, ROWS, TYPES, "archive")
+    cache.put("select id from products", COLUMNS, ROWS, TYPES, "sales")
+
+    cache.invalidate_for("update users set name = 'x'", "sales")
+
+    assert cache.get("select id from orders join users on users.id = orders.user_id", "sales") is None
+    assert cache.get("select id from orders", "archive") is not None
+    assert cache.get("select id from products", "sales") is not None
+
+
+@pytest.mark.parametrize("sql, tables", [
+    ("SELECT * FROM Orders o JOIN users u ON u.id = o.user_id", {"orders", "users"}),
+    ("SELECT * FROM orders LEFT JOIN items ON true", {"orders", "items"}),
+    ("SELECT * FROM (SELECT * FROM sub) AS s", {"sub"}),
+    ("SELECT * FROM sales.orders", {"orders"}),
+    ("SELECT * FROM a, b", {"a", "b"}),
+    ("INSERT INTO logs(a, b) VALUES (1, 2)", {"logs"}),
+    ("UPDATE users SET name = 'x'", {"users"}),
+    ("DELETE FROM sessions WHERE id = 1", {"sessions"}),
+])
+def test_extract_tables(sql, tables):
+    assert extract_tables(sql) == tables
@@ -0,0 +1,56 @@
+import datetime
+from decimal import Decimal
+
+import numpy as np
+
+from src.utils.visualizer import OTHER_LABEL, build_figure_spec, lttb_indices, top_n
+
+
+def test_lttb_keeps_end_points_and_returns_threshold_sorted_indices():
+    x = np.arange(1000, dtype=np.float64)
+    indices = lttb_indices(x, np.sin(x / 50), 100)
+    assert len(indices) == 100
+    assert indices[0] == 0 and indices[-1] == 999
+    assert np.all(np.diff(indices) > 0)
+
+
+def test_lttb_keeps_a_spike():
+    x = np.arange(1000, dtype=np.float64)
+    y = np.zeros(1000)
+    y[537] = 100.0
+    assert 537 in lttb_indices(x, y, 50)
+
+
+def test_lttb_returns_every_index_when_nothing_to_drop():
+    x = np.arange(10, dtype=np.float64)
+    assert list(lttb_indices(x, x, 10)) == list(range(10))
+    assert list(lttb_indices(x, x, 2)) == list(range(10))
+
+
+def test_top_n_sums_per_label_and_folds_the_rest():
+    labels, totals, folded = top_n(["a", "b", "a", "c", "d"], [1, 5, 3, 2, 1], 3)
+    assert folded
+    assert labels == ["b", "a", OTHER_LABEL]
+    assert totals == [5.0, 4.0, 3.0]
+
+
+def test_top_n_without_folding_sorts_by_total():
+    assert top_n(["a", "b", "a"], [1, 5, 3], 3) == (["b", "a"], [5.0, 4.0], False)
+
+
+def test_line_chart_is_downsampled_with_lttb():
+    start = datetime.date(2020, 1, 1)
+    rows = [(start + datetime.timedelta(days=i), Decimal(i % 7)) for i in range(5000)]
+    spec = build_figure_spec(["day", "value"], rows, "day", "value", "line", max_points=500)
+    trace = spec["data"][0]
+    assert len(trace["x"]) == len(trace["y"]) == 500
+    assert (trace["x"][0], trace["x"][-1]) == (rows[0][0], rows[-1][0])
+    assert spec["layout"]["meta"] == {"source_points": 5000, "points": 500, "downsampling": "lttb"}
+
+
+def test_bar_chart_keeps_top_categories():
+    rows = [(f"item{i}", i) for i in range(100)] + [("skipped", None)]
+    spec = build_figure_spec(["name", "sales"], rows, "name", "sales", "bar", max_categories=10)
+    assert spec["data"][0]["x"][:2] == ["item99", "item98"]
+    assert spec["data"][0]["x"][-1] == OTHER_LABEL
+    assert spec["layout"]["meta"] == {"source_points": 100, "points": 10, "downsampling": "top_n"}
@@ -29,9 +29,23 @@ interface QueryResponse {
     rows: any[][];
     types?: string[];
     plot?: boolean;
+    figure?: {
+      data: { type: string; x?: any[]; y?: number[]; labels?: any[]; values?: number[] }[];
+      layout: { meta?: { source_points: number; points: number; downsampling: string | null } };
+    } | null;
+    cursor?: string | null;
+    has_more?: boolean;
   } | null;
   ambiguity?: string | null;
   ambiguity_msg: string;
+  session_id?: string;
+  guard?: {
+    action: 'allowed' | 'limited' | 'rejected';
+    estimated_cost?: number | null;
+    estimated_rows?: number | null;
+    limit?: number | null;
+    reason?: string | null;
+  } | null;
   error?: string | null;
 }
 const App = () => {
@@ -43,9 +57,14 @@ const App = () => {
   const [error, setError] = useState('');
   const [ambiguity, setAmbiguity] = useState('');
   const [plot, setPlot] = useState(false);
+  const [figure, setFigure] = useState<NonNullable<QueryResponse['result']>['figure']>(null);
   const [ambiguity_msg, setAmbiguityMsg] = useState('');
   const [showAllRows, setShowAllRows] = useState(false);
+  const [cursor, setCursor] = useState<string | null>(null);
+  const [loadingPage, setLoadingPage] = useState(false);
+  const [guard, setGuard] = useState<QueryResponse['guard']>(null);
   const [conversation, setConversation] = useState<{ user: string; bot: string }[]>([]);
+  const [sessionId, setSessionId] = useState<string | null>(null);
 
 
   const handleSubmit = async () => {
@@ -61,8 +80,11 @@ const App = () => {
     setRows([]);
     setAmbiguity('');
     setPlot(false);
+    setFigure(null);
     setAmbiguityMsg('');
     setShowAllRows(false);
+    setCursor(null);
+    setGuard(null);
 
 
     try {
@@ -71,7 +93,7 @@ const App = () => {
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ 
           query,
-          history: conversation,
+          session_id: sessionId,
         }),
       });
 
@@ -80,6 +102,7 @@ const App = () => {
       }
 
       const data: QueryResponse = await res.json();
+      setSessionId(data.session_id ?? sessionId);
       setConversation([
         ...conversation,
         { user: query, bot: data.ambiguity_msg || data.sql || data.error || 'No response' },
@@ -101,11 +124,14 @@ const App = () => {
       }
 
       setSql(data.sql || '');
+      setGuard(data.guard ?? null);
 
       if (data.result && Array.isArray(data.result.columns) && Array.isArray(data.result.rows)) {
         setColumns(data.result.columns);
         setRows(data.result.rows);
         setPlot(data.result.plot || false);
+        setFigure(data.result.figure ?? null);
+        setCursor(data.result.cursor ?? null);
       } else {
         setColumns([]);
         setRows([]);
@@ -118,6 +144,41 @@ const App = () => {
     }
   };
 
+  const handleLoadMore = async () => {
+    if (!cursor) return;
+
+    setLoadingPage(true);
+    try {
+      const res = await fetch('http://localhost:8000/api/query/page', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ cursor }),
+      });
+
+      if (!res.ok) {
+        throw new Error(`HTTP error! status: ${res.status}`);
+      }
+
+      const data: QueryResponse = await res.json();
+      setSessionId(data.session_id ?? sessionId);
+      if (data.error) {
+        setError(data.error);
+        setCursor(null);
+        return;
+      }
+      if (data.result) {
+        setRows((prev) => [...prev, ...data.result!.rows]);
+        setCursor(data.result.cursor ?? null);
+        setShowAllRows(true);
+      }
+    } catch (err: any) {
+      setError('Failed to fetch more rows. See console.');
+      console.error(err);
+    } finally {
+      setLoadingPage(false);
+    }
+  };
+
   return (
     <>
 <AppBar position="static" sx={{ backgroundColor: '' }}>
@@ -215,6 +276,12 @@ const App = () => {
           </Alert>
         )}
 
+        {guard && guard.action !== 'allowed' && guard.reason && (
+          <Alert severity={guard.action === 'rejected' ? 'error' : 'warning'} sx={{ mt: 2 }}>
+            {guard.reason}
+          </Alert>
+        )}
+
         {sql && (
           <Box mt={4}>
             <Typography variant="subtitle1" gutterBottom>
@@ -268,10 +335,48 @@ const App = () => {
                 </Button>
               </Box>
             )}
+
+            {cursor && (
+              <Box mt={1} textAlign="center">
+                <Button onClick={handleLoadMore} disabled={loadingPage}>
+                  {loadingPage ? 'Loading…' : `Load more rows (${rows.length} loaded)`}
+                </Button>
+              </Box>
+            )}
           </Box>
         )}
 
-        {columns.length >= 2 && rows.length > 0 && plot && (
+        {figure && figure.data.length > 0 && (
+        <Box mt={4}>
+          <Typography variant="subtitle1" gutterBottom>
+            Chart:
+          </Typography>
+          {figure.layout.meta?.downsampling && (
+            <Typography variant="caption" display="block" gutterBottom>
+              {figure.layout.meta.points} of {figure.layout.meta.source_points} points shown ({figure.layout.meta.downsampling})
+            </Typography>
+          )}
+
+          <ResponsiveContainer width="100%" height={300}>
+            <LineChart
+              data={(figure.data[0].x ?? figure.data[0].labels ?? []).map((x, i) => ({
+                x,
+                y: (figure.data[0].y ?? figure.data[0].values ?? [])[i],
+              }))}
+              margin={{ top: 5, right: 30, left: 20, bottom: 5 }}
+            >
+              <CartesianGrid strokeDasharray="3 3" />
+              <XAxis dataKey="x" />
+              <YAxis />
+              <Tooltip />
+              <Legend />
+              <Line type="monotone" dataKey="y" stroke="#8884d8" dot={false} />
+            </LineChart>
+          </ResponsiveContainer>
+        </Box>
+        )}
+
+        {!figure && columns.length >= 2 && rows.length > 0 && plot && (
         <Box mt={4}>
           <Typography variant="subtitle1" gutterBottom>
             Chart: